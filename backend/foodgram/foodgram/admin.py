@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+
+class CappedCountPaginator(Paginator):
+    """Постраничный вывод для списков админки: строки считаются
+    не дальше ADMIN_COUNT_LIMIT, поэтому COUNT по большой таблице
+    не просматривает ее целиком"""
+
+    @cached_property
+    def count(self):
+        return self.object_list.values('pk')[
+            :settings.ADMIN_COUNT_LIMIT].count()
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    """Список без полного подсчета строк таблицы"""
+
+    paginator = CappedCountPaginator
+    show_full_result_count = False
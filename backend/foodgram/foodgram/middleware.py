@@ -0,0 +1,154 @@
+"""Замер времени запроса и SQL без DEBUG.
+
+Запросы к БД считаются и замеряются через connection.execute_wrapper,
+время делится на работу представления, сериализацию (serializer.data
+DRF вместе с запросами, которые выполняют сериализаторы), отрисовку
+ответа (response.render(), для DRF - JSONRenderer) и SQL.
+Итоги уходят в заголовок Server-Timing, медленные запросы - в журнал
+foodgram.slow_requests с самыми частыми формами SQL: десятки
+одинаковых запросов на один ответ - признак N+1.
+"""
+import json
+import logging
+import re
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger('foodgram.slow_requests')
+
+# замеры текущего запроса (request._timing) для сериализаторов,
+# которым запрос не передается
+current_timing = ContextVar('current_timing', default=None)
+serializer_data = BaseSerializer.data.fget
+
+# списки параметров разной длины в IN (...) - одна форма запроса
+PLACEHOLDERS = re.compile(r'\((?:%s, )*%s\)')
+
+
+class QueryStats:
+    """Количество и время запросов к БД по формам SQL"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = defaultdict(lambda: [0, 0.0])
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            shape = self.shapes[PLACEHOLDERS.sub('(...)', sql)]
+            shape[0] += 1
+            shape[1] += duration
+
+    def get_top_shapes(self, limit):
+        """[(SQL, количество, секунд)] самых частых форм запросов"""
+        shapes = sorted(
+            self.shapes.items(), key=lambda item: item[1], reverse=True)
+        return [(sql, count, duration)
+                for sql, (count, duration) in shapes[:limit]]
+
+
+def timed_serializer_data(serializer):
+    """serializer.data с замером времени: Serializer и ListSerializer
+    вызывают его через super(), вложенные вызовы (serializer.data внутри
+    SerializerMethodField) входят во время внешнего"""
+    timing = current_timing.get()
+    if timing is None or timing.get('serializing'):
+        return serializer_data(serializer)
+    timing['serializing'] = True
+    started = time.perf_counter()
+    try:
+        return serializer_data(serializer)
+    finally:
+        timing['serializing'] = False
+        timing['serialize'] = (
+            timing.get('serialize', 0.0) + time.perf_counter() - started)
+
+
+BaseSerializer.data = property(timed_serializer_data)
+
+
+class RequestTimingMiddleware:
+    """Заголовок Server-Timing и журнал медленных запросов"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        request._timing = {}
+        token = current_timing.set(request._timing)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        finished = time.perf_counter()
+
+        view_started = request._timing.get('view_started', started)
+        view_finished = request._timing.get('view_finished', finished)
+        serialize = request._timing.get('serialize', 0.0)
+        timings = {
+            'total': finished - started,
+            'db': stats.duration,
+            'view': view_finished - view_started - serialize,
+            'serialize': serialize,
+            'render': request._timing.get('render', 0.0),
+        }
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={duration * 1000:.1f}'
+            + (f';desc="SQL x{stats.count}"' if name == 'db' else '')
+            for name, duration in timings.items())
+        if timings['total'] * 1000 >= settings.SLOW_REQUEST_THRESHOLD_MS:
+            self.log_slow_request(request, response, timings, stats)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._timing['view_started'] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # ответ DRF отрисовывается после выхода из представления и
+        # остальных middleware, время отрисовки замеряется отдельно
+        request._timing['view_finished'] = time.perf_counter()
+        render = response.render
+
+        def timed_render():
+            started = time.perf_counter()
+            try:
+                return render()
+            finally:
+                request._timing['render'] = time.perf_counter() - started
+
+        response.render = timed_render
+        return response
+
+    def log_slow_request(self, request, response, timings, stats):
+        record = {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            **{f'{name}_ms': round(duration * 1000, 1)
+               for name, duration in timings.items()},
+            'queries': stats.count,
+            'top_queries': [
+                {'sql': sql, 'count': count,
+                 'ms': round(duration * 1000, 1)}
+                for sql, count, duration in stats.get_top_shapes(
+                    settings.SLOW_REQUEST_TOP_QUERIES)
+            ],
+        }
+        logger.warning(json.dumps(record, ensure_ascii=False))
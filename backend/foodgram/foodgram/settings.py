@@ -18,6 +18,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'foods',
     'users',
+    'jobs',
     'rest_framework',
     'sorl.thumbnail',
     'django_filters',
@@ -26,6 +27,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,6 +70,47 @@ DATABASES = {
     }
 }
 
+# Кэши общие для всех процессов gunicorn. Версии данных и страницы
+# списка рецептов хранятся отдельно от остального (токены, количества,
+# статистика): вытеснение страниц не сбрасывает версии, а значит ETag.
+# Файловый кэш при превышении MAX_ENTRIES удаляет 1/CULL_FREQUENCY
+# случайных записей, поэтому MAX_ENTRIES с запасом больше числа ключей.
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND',
+    default='django.core.cache.backends.filebased.FileBasedCache')
+CACHE_LOCATION = os.getenv(
+    'CACHE_LOCATION', default=os.path.join(BASE_DIR, 'cache'))
+CACHE_SIZES = {
+    'default': 20000,
+    'versions': 1000,
+    'pages': 5000,
+}
+
+
+def get_cache_settings(alias, max_entries):
+    """Свой каталог файлового кэша, своя область кэша в памяти или
+    свой префикс ключей общего сервера (Redis, Memcached)"""
+    cache_settings = {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+        'KEY_PREFIX': alias,
+    }
+    if CACHE_BACKEND.endswith('.FileBasedCache'):
+        cache_settings['LOCATION'] = os.path.join(CACHE_LOCATION, alias)
+    elif CACHE_BACKEND.endswith('.LocMemCache'):
+        cache_settings['LOCATION'] = alias
+    else:
+        return cache_settings
+    cache_settings['OPTIONS'] = {
+        'MAX_ENTRIES': max_entries, 'CULL_FREQUENCY': 4}
+    return cache_settings
+
+
+CACHES = {
+    alias: get_cache_settings(alias, max_entries)
+    for alias, max_entries in CACHE_SIZES.items()
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -97,7 +140,59 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', default=os.path.join(BASE_DIR, 'media'))
+
+INGREDIENT_INDEX_PATH = os.getenv(
+    'INGREDIENT_INDEX_PATH',
+    default=os.path.join(BASE_DIR, 'ingredient_index.bin'))
+# Больше этого количества ингредиентов поиск по названию не отдает
+INGREDIENT_SEARCH_LIMIT = 50
+
+# Время хранения страниц списка рецептов в кэше, секунд
+RECIPE_PAGE_CACHE_TIMEOUT = 600
+
+# Время хранения количества объектов в списках, секунд
+COUNT_CACHE_TIMEOUT = 60
+# С этого количества по оценке планировщика PostgreSQL точный COUNT
+# не выполняется
+COUNT_ESTIMATE_THRESHOLD = 100000
+
+# Кэш токенов авторизации: время хранения в общем кэше, секунд,
+# время хранения и размер кэша процесса. Кэш процесса не знает об
+# удалении токена в других процессах, поэтому по умолчанию выключен
+TOKEN_CACHE_TIMEOUT = 300
+TOKEN_LOCAL_CACHE_TIMEOUT = int(
+    os.getenv('TOKEN_LOCAL_CACHE_TIMEOUT', default=0))
+TOKEN_LOCAL_CACHE_SIZE = 1000
+
+# Больше этого количества строк списки админки не считают
+ADMIN_COUNT_LIMIT = 10000
+
+# Запросы дольше порога, мс, записываются в журнал
+# foodgram.slow_requests вместе с самыми частыми формами SQL
+SLOW_REQUEST_THRESHOLD_MS = int(
+    os.getenv('SLOW_REQUEST_THRESHOLD_MS', default=500))
+SLOW_REQUEST_TOP_QUERIES = 5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'foodgram.slow_requests': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# Выполнять фоновые задачи в процессе веб-приложения, без run_workers.
+# По умолчанию включено при DEBUG=True: под runserver обработчиков нет,
+# и без них индекс ингредиентов и копии картинок не обновлялись бы
+JOBS_EAGER = os.getenv('JOBS_EAGER', default=str(DEBUG)) == 'True'
 
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -111,7 +206,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
 
     ],
     'DEFAULT_FILTER_BACKENDS': (
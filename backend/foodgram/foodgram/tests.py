@@ -0,0 +1,54 @@
+import re
+import time
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ListSerializer
+
+from foods.tests import LOCAL_CACHES
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class RequestTimingTest(TestCase):
+    """Сериализация и отрисовка ответа DRF не входят во время
+    представления"""
+
+    def get_timings(self, response):
+        return {
+            name: float(duration) for name, duration in re.findall(
+                r'(\w+);dur=([\d.]+)', response['Server-Timing'])}
+
+    def test_render_timed_separately(self):
+        render = JSONRenderer.render
+
+        def slow_render(*args, **kwargs):
+            time.sleep(0.05)
+            return render(*args, **kwargs)
+
+        with mock.patch.object(JSONRenderer, 'render', slow_render):
+            response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        timings = self.get_timings(response)
+        self.assertGreaterEqual(timings['render'], 50)
+        self.assertLess(timings['view'], 50)
+        self.assertLessEqual(
+            timings['view'] + timings['render'], timings['total'])
+
+    def test_serialization_timed_separately(self):
+        to_representation = ListSerializer.to_representation
+
+        def slow_to_representation(*args, **kwargs):
+            time.sleep(0.05)
+            return to_representation(*args, **kwargs)
+
+        with mock.patch.object(
+                ListSerializer, 'to_representation', slow_to_representation):
+            response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        timings = self.get_timings(response)
+        self.assertGreaterEqual(timings['serialize'], 50)
+        self.assertLess(timings['view'], 50)
+        self.assertLessEqual(
+            timings['view'] + timings['serialize'] + timings['render'],
+            timings['total'])
@@ -1,60 +1,141 @@
 from django.contrib import admin
 
+from .cache import bump_versions
 from .models import (
     FavoritedRecipeByUser, Ingredient, MeasurementUnit, Recipe,
     RecipeIngredient, Tag
 )
+from .services import rebuild_recipe_shopping_lists, recount_recipe_counters
+from foodgram.admin import ScalableModelAdmin
+
+
+class VersionedAdminMixin:
+    """Новая версия модели после изменений в админке для моделей
+    без сигналов"""
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        bump_versions(self.model)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        bump_versions(self.model)
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        bump_versions(self.model)
+
+
+class ChangedRecipesAdminMixin:
+    """Обработка рецептов, записи которых изменены в админке"""
+
+    def recipes_changed(self, recipe_ids):
+        raise NotImplementedError
+
+    def save_model(self, request, obj, form, change):
+        # при замене рецепта затронуты прежний и новый
+        recipe_ids = {obj.recipe_id, form.initial.get('recipe')} - {None}
+        super().save_model(request, obj, form, change)
+        self.recipes_changed(recipe_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.recipes_changed([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        self.recipes_changed(recipe_ids)
+
+
+class RecipeCounterAdminMixin(ChangedRecipesAdminMixin,
+                              VersionedAdminMixin):
+    """Пересчет счетчиков рецептов, затронутых изменениями в админке"""
+
+    def recipes_changed(self, recipe_ids):
+        recount_recipe_counters(recipe_ids)
 
 
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
     extra = 1
+    autocomplete_fields = ('recipe_ingredients',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'recipe', 'recipe_ingredients')
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(ScalableModelAdmin):
     inlines = (RecipeIngredientInline,)
 
     list_display = ('title', 'in_favorites', 'author', 'pub_date')
+    list_select_related = ('author',)
     readonly_fields = ('in_favorites',)
-    list_filter = ('author', 'title', 'tags')
+    # фильтры с постоянным набором значений, автор и название - поиском
+    list_filter = ('tags', 'pub_date')
+    search_fields = ('title', 'author__username')
+    autocomplete_fields = ('author', 'tags')
 
+    @admin.display(
+        description='Находится списке избранного (количество)',
+        ordering='favorites_count',
+    )
     def in_favorites(self, obj):
-        return FavoritedRecipeByUser.objects.filter(recipe=obj).count()
+        return obj.favorites_count
 
-    in_favorites.short_description = 'Находится списке избранного (количество)'
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if change:
+            # ингредиенты могли измениться в RecipeIngredientInline
+            rebuild_recipe_shopping_lists([form.instance.id])
 
 
 @admin.register(RecipeIngredient)
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(ChangedRecipesAdminMixin, ScalableModelAdmin):
     list_display = ('recipe', 'recipe_ingredients', 'recipe_id',)
+    list_select_related = ('recipe', 'recipe_ingredients')
+    autocomplete_fields = ('recipe', 'recipe_ingredients')
+
+    def recipes_changed(self, recipe_ids):
+        rebuild_recipe_shopping_lists(recipe_ids)
 
     @admin.display(
         description='Рецепт',
     )
     def recipe_id(self, obj):
-        return obj.recipe.id
+        return obj.recipe_id
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(ScalableModelAdmin):
 
     list_display = (
         'title', 'measurement_unit')
-    list_filter = ('title',)
+    list_select_related = ('measurement_unit',)
+    list_filter = ('measurement_unit',)
+    search_fields = ('^title',)
+    # порядок уникального ограничения - по его индексу
+    ordering = ('title', 'measurement_unit')
 
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     list_display = ('name', 'slug', 'color')
+    search_fields = ('name', 'slug')
 
 
 @admin.register(MeasurementUnit)
 class MeasurementUnitAdmin(admin.ModelAdmin):
     list_display = ('title',)
+    search_fields = ('title',)
 
 
 @admin.register(FavoritedRecipeByUser)
-class FavoritedRecipeByUsersAdmin(admin.ModelAdmin):
+class FavoritedRecipeByUsersAdmin(RecipeCounterAdminMixin,
+                                  ScalableModelAdmin):
     list_display = (
         'current_user', 'recipe')
+    list_select_related = ('current_user', 'recipe')
+    autocomplete_fields = ('current_user', 'recipe')
@@ -5,3 +5,6 @@ class FoodConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'foods'
     verbose_name = 'Продуктовый помошник (рецепты)'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,99 @@
+"""Версии редко меняющихся данных для условных GET-запросов.
+
+Версия модели - отметка времени ее последнего изменения в отдельном
+общем кэше versions. Сигналы моделей и пакетные операции обновляют
+версию после фиксации транзакции; ETag и Last-Modified ответа
+вычисляются по версиям без обращения к БД, поэтому повторная проверка
+клиентом актуальности данных стоит одного чтения из кэша.
+"""
+import hashlib
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+VERSION_KEY = 'foodgram:version:{}'
+# отдельный кэш: вытеснение других записей не сбрасывает версии
+VERSIONS_CACHE = 'versions'
+
+
+def get_label(model):
+    return model._meta.label_lower
+
+
+def get_versions(*labels):
+    """{метка модели: версия}. Версия, вытесненная из кэша, создается
+    заново: клиенты получат полный ответ, но не устаревший."""
+    cache = caches[VERSIONS_CACHE]
+    keys = {VERSION_KEY.format(label): label for label in labels}
+    versions = cache.get_many(keys)
+    missing = keys.keys() - versions.keys()
+    if missing:
+        now = time.time()
+        for key in missing:
+            cache.add(key, now, timeout=None)
+        versions.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def bump_versions(*models):
+    """Новые версии моделей после фиксации текущей транзакции"""
+    labels = [get_label(model) for model in models]
+    transaction.on_commit(lambda: caches[VERSIONS_CACHE].set_many(
+        {VERSION_KEY.format(label): time.time() for label in labels},
+        timeout=None))
+
+
+class NotModifiedError(Exception):
+    """Данные у клиента актуальны, ответ готов заранее"""
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """ETag и Last-Modified для conditional_actions по версиям
+    conditional_models. Если данные у клиента не изменились, ответ 304
+    отдается после проверки прав, до построения queryset и сериализации."""
+
+    conditional_models = ()
+    conditional_actions = ('list', 'retrieve')
+    conditional_headers = None
+
+    def get_conditional_versions(self):
+        return get_versions(
+            *(get_label(model) for model in self.conditional_models))
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (request.method not in ('GET', 'HEAD')
+                or self.action not in self.conditional_actions):
+            return
+        versions = self.get_conditional_versions()
+        state = repr((request.get_full_path(), sorted(versions.items())))
+        etag = quote_etag(hashlib.md5(state.encode()).hexdigest())
+        last_modified = int(max(versions.values(), default=0))
+        self.conditional_headers = (etag, last_modified)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            raise NotModifiedError(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModifiedError):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        if self.conditional_headers and response.status_code in (200, 304):
+            etag, last_modified = self.conditional_headers
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            # клиент должен проверять актуальность при каждом запросе
+            patch_cache_control(response, no_cache=True)
+        return response
@@ -0,0 +1,175 @@
+"""Проверки, общие для команд и тестов.
+
+Формы частых запросов и их планы (check_query_plans, QueryPlanTest),
+сверка JSON RecipeReadSerializer с RecipeSerializer на пограничных
+случаях (check_recipe_serializer, RecipeSerializerParityTest).
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import NotSupportedError, connection, transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from foods.models import (
+    FavoritedRecipeByUser, Ingredient, Recipe, RecipeIngredient, Tag
+)
+from foods.serializers import RecipeReadSerializer, RecipeSerializer
+from foods.views import FavoriteViewSet, RecipeViewSet
+from users.models import ShoppingCartByUser, SubscribersByCurrentUser
+from users.views import SubscriptionViewSet
+
+User = get_user_model()
+
+PAGE_SIZE = 6
+# SQLite: полный просмотр таблицы без индекса
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)$')
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def get_view_queryset(view_class, user, params, action='list'):
+    """Queryset списка так, как его строит представление"""
+    request = Request(APIRequestFactory().get('/', params))
+    request.user = user
+    view = view_class(
+        request=request, args=(), kwargs={}, format_kwarg=None,
+        action=action)
+    return view.filter_queryset(view.get_queryset())
+
+
+def get_query_shapes(user, author, tag_slugs):
+    """{название: queryset} для запросов, выполняемых на каждой странице"""
+    recipes = get_view_queryset(RecipeViewSet, user, {})
+    return {
+        'рецепты: страница': recipes[:PAGE_SIZE],
+        'рецепты: страница по курсору': recipes.order_by(
+            '-pub_date', '-id').filter(
+            pub_date__lt=recipes.values('pub_date')[:1])[:PAGE_SIZE],
+        'рецепты: ?author=': get_view_queryset(
+            RecipeViewSet, user, {'author': author.id})[:PAGE_SIZE],
+        'рецепты: ?tags=': get_view_queryset(
+            RecipeViewSet, user, {'tags': tag_slugs})[:PAGE_SIZE],
+        'рецепты: ?ordering=popular': get_view_queryset(
+            RecipeViewSet, user, {'ordering': 'popular'})[:PAGE_SIZE],
+        'рецепты: ?is_favorited=1': get_view_queryset(
+            RecipeViewSet, user, {'is_favorited': '1'})[:PAGE_SIZE],
+        'рецепты: ?is_in_shopping_cart=1': get_view_queryset(
+            RecipeViewSet, user, {'is_in_shopping_cart': '1'})[:PAGE_SIZE],
+        'избранное: страница': get_view_queryset(
+            FavoriteViewSet, user, {})[:PAGE_SIZE],
+        'подписки: авторы': get_view_queryset(
+            SubscriptionViewSet, user, {})[:PAGE_SIZE],
+        'подписки: рецепты авторов': Recipe.objects.filter(
+            author__in=user.subscribers.values('subscription')
+        ).top_per_author(3),
+        'список покупок': user.shopping_list.values(
+            'ingredient__title', 'ingredient__measurement_unit__title',
+            'amount').order_by('ingredient__title'),
+    }
+
+
+def explain(queryset):
+    """Строки плана запроса и таблицы, просматриваемые целиком"""
+    sql, params = queryset.query.sql_with_params()
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # на маленькой БД полный просмотр дешевле индекса: запрещаем
+            # его, чтобы Seq Scan остался только там, где индекса нет
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}', params)
+            lines = [row[0] for row in cursor.fetchall()]
+            scans = [match.group(1) for line in lines
+                     for match in POSTGRES_SCAN.finditer(line)]
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            lines = [row[-1] for row in cursor.fetchall()]
+            scans = [match.group(1) for line in lines
+                     for match in [SQLITE_SCAN.match(line)] if match]
+        else:
+            raise NotSupportedError(
+                f'EXPLAIN для {connection.vendor} не поддерживается')
+    tables = set(connection.introspection.table_names())
+    return lines, [table for table in scans if table in tables]
+
+
+def get_request(user):
+    request = Request(APIRequestFactory().get('/api/recipes/'))
+    request.user = user
+    return request
+
+
+def render_pair(recipe_ids, user):
+    """[(id, JSON RecipeSerializer, JSON RecipeReadSerializer)]:
+    каждый сериализатор получает queryset так, как его строит
+    представление"""
+    recipes = Recipe.objects.filter(id__in=recipe_ids).with_user_flags(user)
+    reference = RecipeSerializer(
+        recipes.with_related(), many=True,
+        context={'request': get_request(user)}).data
+    fast = RecipeReadSerializer(
+        recipes.select_related('author'), many=True,
+        context={'request': get_request(user)}).data
+    renderer = JSONRenderer()
+    return [
+        (expected['id'], renderer.render(expected), renderer.render(actual))
+        for expected, actual in zip(reference, fast)
+    ]
+
+
+def seed_edge_cases():
+    """Пользователь с избранным, покупками и подпиской и рецепты без
+    тегов, ингредиентов, картинки и с устаревшими копиями картинки"""
+    user = User.objects.create(
+        username='check_recipe_serializer',
+        email='check_recipe_serializer@example.com')
+    author = User.objects.create(
+        username='check_recipe_serializer_author',
+        email='', first_name='Имя "в кавычках"', last_name='\\ / \t')
+    ingredient = Ingredient.objects.create(
+        title='без единицы измерения', measurement_unit=None)
+    tag = Tag.objects.create(
+        name='check_recipe_serializer', slug='check_recipe_serializer',
+        color='#000000')
+    recipes = [
+        Recipe.objects.create(
+            author=author, title='без картинки', description='',
+            image='', time=1),
+        Recipe.objects.create(
+            author=author, title='устаревшие копии',
+            description='строки\nс переводом',
+            image='foods_images/check_recipe_serializer.png',
+            image_variants={'source': 'foods_images/old.png',
+                            'card': '/media/cache/old.jpg'},
+            time=32767),
+        Recipe.objects.create(
+            author=user, title='готовые копии', description='😀',
+            image='foods_images/check_recipe_serializer.png',
+            image_variants={
+                'source': 'foods_images/check_recipe_serializer.png',
+                'card': '/media/cache/card.jpg',
+                'detail': '/media/cache/detail.jpg'},
+            time=5),
+    ]
+    recipes[1].tags.set([tag, *Tag.objects.exclude(id=tag.id)[:2]])
+    RecipeIngredient.objects.create(
+        recipe=recipes[1], recipe_ingredients=ingredient, amount=1)
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipes[2], recipe_ingredients=other,
+                         amount=number + 1)
+        for number, other in enumerate(Ingredient.objects.all()[:5]))
+    SubscribersByCurrentUser.objects.create(
+        current_user=user, subscription=author)
+    other_recipes = list(Recipe.objects.exclude(author=author)[:10])
+    FavoritedRecipeByUser.objects.bulk_create(
+        FavoritedRecipeByUser(current_user=user, recipe=recipe)
+        for recipe in [recipes[1], *other_recipes[::2]])
+    ShoppingCartByUser.objects.bulk_create(
+        ShoppingCartByUser(current_user=user, recipe=recipe)
+        for recipe in [recipes[0], *other_recipes[1::3]])
+    SubscribersByCurrentUser.objects.bulk_create(
+        SubscribersByCurrentUser(current_user=user,
+                                 subscription_id=author_id)
+        for author_id in {recipe.author_id for recipe in other_recipes}
+        - {user.id, author.id})
+    return user
@@ -1,16 +1,56 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
-from foods.models import FavoritedRecipeByUser, Tag
+from foods.cache import get_label, get_versions
+from foods.models import FavoritedRecipeByUser, Recipe, Tag
 from users.models import ShoppingCartByUser
 
+# сначала рецепты, которые чаще добавляют в избранное
+POPULAR_ORDERING = ('-favorites_count', '-pub_date', '-id')
+
+# (версия тегов, {слаг: id}) - общий для запросов процесса
+_tag_ids = (None, {})
+
+
+def get_tag_ids():
+    """{слаг: id} всех тегов. Перечитывается из БД только после
+    изменения тегов в любом процессе, проверка версии - одно
+    чтение из кэша."""
+    global _tag_ids
+    label = get_label(Tag)
+    version = get_versions(label)[label]
+    if _tag_ids[0] != version:
+        _tag_ids = (version, dict(Tag.objects.values_list('slug', 'id')))
+    return _tag_ids[1]
+
+
+def get_tag_choices():
+    return [(slug, slug) for slug in get_tag_ids()]
+
 
 class RecipeFilter(filters.FilterSet):
     """Фильтрация по тегу по избранному и списку покупок и автору"""
-    tags = filters.ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug',
-    )
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tag_choices, method='get_tags')
+
+    def get_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов. Проверка через EXISTS
+        не размножает рецепты с несколькими подходящими тегами,
+        поэтому DISTINCT не нужен."""
+        if not value:
+            return queryset
+        tag_ids = get_tag_ids()
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'),
+            tag_id__in=[tag_ids[slug] for slug in value if slug in tag_ids])))
+
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'По популярности'),), method='get_ordering')
+
+    def get_ordering(self, queryset, name, value):
+        """popular - по счетчику избранного, без подсчета по таблице
+        избранного"""
+        return queryset.order_by(*POPULAR_ORDERING)
 
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
 
@@ -0,0 +1,71 @@
+"""Уменьшенные копии картинок рецептов.
+
+Копии создает sorl.thumbnail фоновой задачей после загрузки картинки.
+Ссылки на них сохраняются в Recipe.image_variants вместе с именем
+исходного файла: пока копии для текущей картинки не готовы,
+сериализаторы отдают вместо них оригинал.
+"""
+from sorl.thumbnail import get_thumbnail
+
+from .cache import bump_versions
+from .models import Recipe
+from jobs.queue import enqueue
+
+# название: (геометрия sorl, дополнительные параметры)
+RECIPE_IMAGE_VARIANTS = {
+    'card': ('480x320', {'crop': 'center'}),
+    'detail': ('960', {}),
+    'retina': ('1920', {}),
+}
+THUMBNAIL_OPTIONS = {
+    'format': 'JPEG',
+    'quality': 80,
+    'progressive': True,
+    'upscale': False,
+}
+SOURCE_KEY = 'source'
+
+
+def make_variants(image):
+    """{название копии: url} для файла картинки"""
+    variants = {SOURCE_KEY: image.name}
+    for name, (geometry, options) in RECIPE_IMAGE_VARIANTS.items():
+        variants[name] = get_thumbnail(
+            image, geometry, **THUMBNAIL_OPTIONS, **options).url
+    return variants
+
+
+def save_variants(recipe_id, variants):
+    """Сохраняет копии, если картинка рецепта за это время не сменилась"""
+    updated = Recipe.objects.filter(
+        id=recipe_id, image=variants[SOURCE_KEY]
+    ).update(image_variants=variants)
+    if updated:
+        bump_versions(Recipe)
+    return updated
+
+
+def generate_variants(recipe_id):
+    recipe = Recipe.objects.filter(id=recipe_id).only('id', 'image').first()
+    if recipe is None or not recipe.image:
+        return
+    save_variants(recipe_id, make_variants(recipe.image))
+
+
+def get_variant_urls(recipe):
+    """Ссылки на копии текущей картинки рецепта, для еще не готовых
+    копий - ссылка на оригинал"""
+    if not recipe.image:
+        return dict.fromkeys(RECIPE_IMAGE_VARIANTS)
+    variants = recipe.image_variants or {}
+    if variants.get(SOURCE_KEY) != recipe.image.name:
+        variants = {}
+    return {
+        name: variants.get(name) or recipe.image.url
+        for name in RECIPE_IMAGE_VARIANTS
+    }
+
+
+def schedule_variants(recipe_id):
+    """Создание копий фоновой задачей"""
+    enqueue('foods.generate_image_variants', unique=True, recipe_id=recipe_id)
@@ -0,0 +1,249 @@
+"""Индекс ингредиентов для поиска по названию.
+
+Индекс собирается в один файл, который все процессы gunicorn открывают
+через mmap: страницы файла лежат в page cache в одном экземпляре,
+поиск не обращается к БД. Формат файла:
+
+    заголовок     MAGIC, число записей, длины блоков ключей и записей
+    key_offsets   (count + 1) x uint32, смещения ключей в блоке ключей
+    rec_offsets   (count + 1) x uint32, смещения записей в блоке записей
+    keys          названия в нижнем регистре, отсортированные, через \\n
+    records       id, название и единица измерения через \\x1f
+    gram_hashes   отсортированные crc32 триграмм названий, uint32
+    gram_offsets  (grams + 1) x uint32, смещения списков в postings
+    postings      номера названий, содержащих триграмму, по возрастанию
+
+Начало названия ищется бинарным поиском по ключам, вхождение в середину
+- проверкой названий из самого короткого списка триграмм запроса.
+Результаты: сначала названия, начинающиеся с запроса, затем содержащие
+его, внутри групп - по алфавиту.
+"""
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from django.conf import settings
+
+from .models import Ingredient
+from jobs.queue import enqueue
+
+MAGIC = b'FGI2'
+HEADER = struct.Struct('=4sIIIII')
+GRAM_SIZE = 3
+# Дальше пересекать списки дороже, чем проверить кандидатов
+INTERSECTED_POSTINGS = 3
+KEY_SEPARATOR = b'\n'
+FIELD_SEPARATOR = '\x1f'
+UNDEFINED_UNIT = 'Не определено'
+
+_lock = threading.Lock()
+_opened = {}
+
+
+class IngredientIndex:
+    """Открытый через mmap файл индекса"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as index_file:
+            self.stat = os.fstat(index_file.fileno())
+            self.buffer = mmap.mmap(
+                index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.count, keys_size, records_size,
+         grams_count, postings_count) = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise ValueError(f'{path} не является индексом ингредиентов')
+        view = memoryview(self.buffer)
+        offsets_size = (self.count + 1) * 4
+        sizes = (offsets_size, offsets_size, keys_size, records_size,
+                 grams_count * 4, (grams_count + 1) * 4, postings_count * 4)
+        sections, position = [], HEADER.size
+        for size in sizes:
+            sections.append(view[position:position + size])
+            position += size
+        self.key_offsets = sections[0].cast('I')
+        self.record_offsets = sections[1].cast('I')
+        self.keys_start = HEADER.size + 2 * offsets_size
+        self.keys_end = self.keys_start + keys_size
+        self.records_start = self.keys_end
+        self.gram_hashes = sections[4].cast('I')
+        self.gram_offsets = sections[5].cast('I')
+        self.postings = sections[6].cast('I')
+
+    def is_current(self, stat):
+        return (self.stat.st_ino, self.stat.st_mtime_ns) == (
+            stat.st_ino, stat.st_mtime_ns)
+
+    def key(self, number):
+        return self.buffer[
+            self.keys_start + self.key_offsets[number]:
+            self.keys_start + self.key_offsets[number + 1] - 1]
+
+    def record(self, number):
+        offsets, start = self.record_offsets, self.records_start
+        ingredient_id, title, unit = self.buffer[
+            start + offsets[number]:start + offsets[number + 1]
+        ].decode().split(FIELD_SEPARATOR)
+        return {
+            'id': int(ingredient_id),
+            'name': title,
+            'measurement_unit': unit,
+        }
+
+    def lower_bound(self, needle):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < needle:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def search(self, name, limit):
+        needle = name.lower().encode()
+        if KEY_SEPARATOR in needle:
+            return []
+        numbers = []
+        number = self.lower_bound(needle)
+        while (len(numbers) < limit and number < self.count
+               and self.key(number).startswith(needle)):
+            numbers.append(number)
+            number += 1
+        if needle and len(numbers) < limit:
+            numbers.extend(self.find_inside(name.lower()))
+        return [self.record(number) for number in numbers[:limit]]
+
+    def find_inside(self, needle):
+        """Номера ключей, содержащих needle не с начала"""
+        grams = get_grams(needle)
+        encoded = needle.encode()
+        if not grams:
+            return self.scan_inside(encoded)
+        postings = []
+        for gram in grams:
+            position = bisect_left(self.gram_hashes, gram)
+            if (position == len(self.gram_hashes)
+                    or self.gram_hashes[position] != gram):
+                return []
+            postings.append(self.postings[
+                self.gram_offsets[position]:
+                self.gram_offsets[position + 1]])
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:INTERSECTED_POSTINGS]:
+            candidates.intersection_update(posting)
+        buffer, offsets, start = self.buffer, self.key_offsets, self.keys_start
+        inside = []
+        for number in sorted(candidates):
+            key = buffer[start + offsets[number]:start + offsets[number + 1]]
+            if encoded in key and not key.startswith(encoded):
+                inside.append(number)
+        return inside
+
+    def scan_inside(self, needle):
+        """Поиск коротких запросов просмотром всех ключей"""
+        numbers = []
+        position = self.buffer.find(needle, self.keys_start, self.keys_end)
+        while position != -1:
+            offset = position - self.keys_start
+            number = bisect_right(self.key_offsets, offset) - 1
+            if offset != self.key_offsets[number]:
+                numbers.append(number)
+            position = self.buffer.find(
+                needle,
+                self.keys_start + self.key_offsets[number + 1],
+                self.keys_end)
+        return numbers
+
+
+def get_grams(text):
+    return {
+        zlib.crc32(text[start:start + GRAM_SIZE].encode())
+        for start in range(len(text) - GRAM_SIZE + 1)
+    }
+
+
+def get_index():
+    """Текущий индекс или None, если файл еще не собран.
+    Пересобранный файл подхватывается по смене inode/mtime."""
+    try:
+        stat = os.stat(settings.INGREDIENT_INDEX_PATH)
+    except FileNotFoundError:
+        return None
+    index = _opened.get('index')
+    if index is None or not index.is_current(stat):
+        with _lock:
+            index = _opened.get('index')
+            if index is None or not index.is_current(stat):
+                _opened['index'] = IngredientIndex(
+                    settings.INGREDIENT_INDEX_PATH)
+    return _opened['index']
+
+
+def search_ingredients(name):
+    """Не больше INGREDIENT_SEARCH_LIMIT ингредиентов по названию
+    из индекса или None, если индекс недоступен и поиск нужно выполнить
+    в БД."""
+    try:
+        index = get_index()
+    except (OSError, ValueError):
+        return None
+    if index is None:
+        return None
+    return index.search(name, settings.INGREDIENT_SEARCH_LIMIT)
+
+
+def build_index(path=None):
+    """Собирает индекс по всем ингредиентам и атомарно
+    заменяет им файл, открытые индексы продолжают работать."""
+    path = path or settings.INGREDIENT_INDEX_PATH
+    rows = sorted(
+        (title.lower().replace('\n', ' ').encode(),
+         ingredient_id, title, unit)
+        for ingredient_id, title, unit in Ingredient.objects.values_list(
+            'id', 'title', 'measurement_unit__title').iterator())
+    key_offsets, record_offsets = array('I', [0]), array('I', [0])
+    keys, records = bytearray(), bytearray()
+    gram_postings = defaultdict(lambda: array('I'))
+    for number, (key, ingredient_id, title, unit) in enumerate(rows):
+        keys += key + KEY_SEPARATOR
+        records += FIELD_SEPARATOR.join(
+            (str(ingredient_id), title, unit or UNDEFINED_UNIT)).encode()
+        key_offsets.append(len(keys))
+        record_offsets.append(len(records))
+        for gram in get_grams(key.decode()):
+            gram_postings[gram].append(number)
+    gram_hashes = array('I', sorted(gram_postings))
+    gram_offsets, postings = array('I', [0]), array('I')
+    for gram in gram_hashes:
+        postings.extend(gram_postings[gram])
+        gram_offsets.append(len(postings))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(descriptor, 'wb') as index_file:
+            index_file.write(HEADER.pack(
+                MAGIC, len(rows), len(keys), len(records),
+                len(gram_hashes), len(postings)))
+            for part in (key_offsets, record_offsets, keys, records,
+                         gram_hashes, gram_offsets, postings):
+                index_file.write(part)
+        os.chmod(temporary_path, 0o644)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+    return len(rows)
+
+
+def schedule_rebuild():
+    """Пересборка индекса фоновой задачей после фиксации транзакции"""
+    enqueue('foods.rebuild_ingredient_index', unique=True)
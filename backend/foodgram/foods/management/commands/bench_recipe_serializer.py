@@ -0,0 +1,78 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from foods.diagnostics import get_request
+from foods.models import Recipe
+from foods.serializers import RecipeReadSerializer, RecipeSerializer
+from users.models import SubscribersByCurrentUser
+
+User = get_user_model()
+
+SERIALIZERS = (
+    ('RecipeSerializer', RecipeSerializer,
+     lambda recipes: recipes.with_related()),
+    ('RecipeReadSerializer', RecipeReadSerializer,
+     lambda recipes: recipes.select_related('author')),
+)
+
+
+class Command(BaseCommand):
+    help = ('Замер вывода страницы рецептов через RecipeSerializer и '
+            'RecipeReadSerializer: загрузка, сериализация и JSON, '
+            'время на рецепт')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=6)
+        parser.add_argument('--pages', type=int, default=20,
+                            help='Страниц, последовательно с начала')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--anonymous', action='store_true',
+                            help='Без признаков пользователя')
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True)[
+            :page_size * options['pages']])
+        if not recipe_ids:
+            raise CommandError('Нужна заполненная БД: рецептов нет')
+        pages = [recipe_ids[start:start + page_size]
+                 for start in range(0, len(recipe_ids), page_size)]
+        user = AnonymousUser()
+        if not options['anonymous']:
+            subscriber = SubscribersByCurrentUser.objects.values_list(
+                'current_user', flat=True).first()
+            if subscriber is not None:
+                user = User.objects.get(id=subscriber)
+
+        renderer = JSONRenderer()
+        results = {}
+        for name, serializer_class, prepare in SERIALIZERS:
+            timings = []
+            for _ in range(options['repeat']):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    for page in pages:
+                        recipes = prepare(Recipe.objects.filter(
+                            id__in=page).with_user_flags(user))
+                        renderer.render(serializer_class(
+                            recipes, many=True,
+                            context={'request': get_request(user)}).data)
+                    timings.append(time.perf_counter() - started)
+            results[name] = min(timings)
+            self.stdout.write(
+                f'{name}: {min(timings) / len(recipe_ids) * 1e6:.0f} мкс '
+                f'на рецепт (лучшее), '
+                f'{sum(timings) / len(timings) / len(recipe_ids) * 1e6:.0f}'
+                f' мкс (среднее), запросов на страницу: '
+                f'{len(queries.captured_queries) / len(pages):.1f}')
+
+        reference, fast = results.values()
+        self.stdout.write(
+            f'рецептов: {len(recipe_ids)}, страниц: {len(pages)}, '
+            f'пользователь: {user}, ускорение: {reference / fast:.1f}x')
@@ -0,0 +1,81 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from foods.models import Ingredient, MeasurementUnit, Recipe, RecipeIngredient
+from foods.services import (
+    calculate_shopping_lists, download_shopping_cart, rebuild_shopping_lists
+)
+from users.models import ShoppingCartByUser
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Замер формирования списка покупок на большой корзине. '
+            'Данные создаются внутри транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=20)
+        parser.add_argument('--catalog', type=int, default=5000,
+                            help='Размер каталога ингредиентов')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self.seed(options)
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                calculate_shopping_lists([user.id])
+            recalculation = (
+                (time.perf_counter() - started) / options['repeat'])
+            rebuild_shopping_lists([user.id])
+            timings = []
+            for _ in range(options['repeat']):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    lines = size = 0
+                    for line in download_shopping_cart(user):
+                        lines += 1
+                        size += len(line.encode())
+                    timings.append(time.perf_counter() - started)
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f'рецептов в корзине: {options["recipes"]}, '
+            f'строк: {lines}, байт: {size}, '
+            f'запросов: {len(queries.captured_queries)}')
+        self.stdout.write(
+            f'лучшее время: {min(timings) * 1000:.1f} мс, '
+            f'среднее: {sum(timings) / len(timings) * 1000:.1f} мс')
+        self.stdout.write(
+            f'пересчет по спискам покупок: {recalculation * 1000:.1f} мс')
+
+    def seed(self, options):
+        user = User.objects.create(username='bench_shopping_cart')
+        unit = MeasurementUnit.objects.create(title='bench_shopping_cart')
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(title=f'bench ingredient {number}',
+                       measurement_unit=unit)
+            for number in range(options['catalog']))
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=user, title=f'bench recipe {number}',
+                   description='', image='foods_images/bench.png', time=1)
+            for number in range(options['recipes']))
+        per_recipe = options['ingredients_per_recipe']
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                recipe_ingredients=ingredients[
+                    (index * per_recipe + offset) % len(ingredients)],
+                amount=offset + 1)
+            for index, recipe in enumerate(recipes)
+            for offset in range(per_recipe))
+        ShoppingCartByUser.objects.bulk_create(
+            ShoppingCartByUser(current_user=user, recipe=recipe)
+            for recipe in recipes)
+        return user
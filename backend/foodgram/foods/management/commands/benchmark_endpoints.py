@@ -0,0 +1,359 @@
+import http.client
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection, connections
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+
+from foodgram.middleware import QueryStats
+from foods.ingredient_index import build_index
+from foods.models import Ingredient, Recipe, Tag
+from foods.seeding import WORDS, seed_dataset
+
+User = get_user_model()
+
+# картинка 1x1 PNG для создаваемых рецептов
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HA'
+         'wCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII=')
+PERCENTILES = (50, 95, 99)
+# доля роста p95 и запросов к БД, при которой сравнение с --baseline
+# считается регрессией
+MAX_REGRESSION = 0.2
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class QueryCountingApp:
+    """WSGI-приложение, которое считает запросы к БД до закрытия
+    ответа: потоковые ответы (список покупок) выполняют SQL при отдаче
+    тела, уже после заголовка Server-Timing"""
+
+    def __init__(self, app):
+        self.app = app
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.finished = {}
+
+    def get_event(self, request_id):
+        with self.lock:
+            return self.finished.setdefault(request_id, threading.Event())
+
+    def __call__(self, environ, start_response):
+        stats = QueryStats()
+        stack = ExitStack()
+        for db in connections.all():
+            stack.enter_context(db.execute_wrapper(stats))
+        try:
+            response = self.app(environ, start_response)
+        except BaseException:
+            stack.close()
+            self.finish(environ.get('HTTP_X_BENCHMARK_REQUEST'), stats.count)
+            raise
+        return CountedResponse(
+            response, stack, stats,
+            environ.get('HTTP_X_BENCHMARK_REQUEST'), self)
+
+    def finish(self, request_id, count):
+        if request_id is not None:
+            self.counts[request_id] = count
+            self.get_event(request_id).set()
+
+    def pop_count(self, request_id):
+        """Запросов к БД за время ответа, после его закрытия сервером"""
+        self.get_event(request_id).wait()
+        with self.lock:
+            del self.finished[request_id]
+        return self.counts.pop(request_id)
+
+
+class CountedResponse:
+    """Тело ответа: счет запросов завершается в close(), который
+    сервер вызывает после отдачи всего тела"""
+
+    def __init__(self, response, stack, stats, request_id, app):
+        self.response = response
+        self.stack = stack
+        self.stats = stats
+        self.request_id = request_id
+        self.app = app
+
+    def __iter__(self):
+        return iter(self.response)
+
+    def close(self):
+        try:
+            if hasattr(self.response, 'close'):
+                self.response.close()
+        finally:
+            self.stack.close()
+            self.app.finish(self.request_id, self.stats.count)
+
+
+class Scenarios:
+    """Запросы сценариев: (метод, путь, тело, с токеном)"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.user = User.objects.get(username='user0')
+        self.token = Token.objects.get_or_create(user=self.user)[0].key
+        self.recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        self.own_recipe_ids = list(
+            self.user.recipes.values_list('id', flat=True))
+        self.author_ids = list(
+            Recipe.objects.values_list('author', flat=True).distinct())
+        self.tag_slugs = list(Tag.objects.values_list('slug', flat=True))
+        self.tag_ids = list(Tag.objects.values_list('id', flat=True))
+        self.ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True))
+        self.pages = max(len(self.recipe_ids) // 6, 1)
+
+    def get(self, name):
+        return getattr(self, name)()
+
+    def page(self):
+        # ранние страницы открывают чаще
+        return min(int(self.rng.expovariate(0.3)) + 1, self.pages)
+
+    def recipes(self):
+        return 'GET', f'/api/recipes/?page={self.page()}', None, True
+
+    def recipes_anonymous(self):
+        return 'GET', f'/api/recipes/?page={self.page()}', None, False
+
+    def recipes_tags(self):
+        tags = '&'.join(
+            f'tags={slug}' for slug in self.rng.sample(self.tag_slugs, 2))
+        return 'GET', f'/api/recipes/?{tags}', None, True
+
+    def recipes_author(self):
+        author = self.rng.choice(self.author_ids)
+        return 'GET', f'/api/recipes/?author={author}', None, True
+
+    def recipes_favorited(self):
+        return 'GET', '/api/recipes/?is_favorited=1', None, True
+
+    def recipes_popular(self):
+        return 'GET', '/api/recipes/?ordering=popular', None, True
+
+    def recipe_detail(self):
+        recipe_id = self.rng.choice(self.recipe_ids)
+        return 'GET', f'/api/recipes/{recipe_id}/', None, True
+
+    def subscriptions(self):
+        return ('GET', '/api/users/subscriptions/?recipes_limit=3',
+                None, True)
+
+    def ingredients_search(self):
+        name = self.rng.choice(WORDS)[:self.rng.randint(2, 4)]
+        return 'GET', f'/api/ingredients/?name={name}', None, False
+
+    def download_shopping_cart(self):
+        return 'GET', '/api/recipes/download_shopping_cart/', None, True
+
+    def get_recipe_data(self):
+        return {
+            'ingredients': [
+                {'id': ingredient_id, 'amount': self.rng.randint(1, 500)}
+                for ingredient_id in self.rng.sample(
+                    self.ingredient_ids, self.rng.randint(3, 12))],
+            'tags': self.rng.sample(self.tag_ids, 2),
+            'cooking_time': self.rng.randint(5, 180),
+        }
+
+    def recipe_create(self):
+        data = {**self.get_recipe_data(), 'image': IMAGE,
+                'name': 'Рецепт замера', 'text': 'Описание'}
+        return 'POST', '/api/recipes/', data, True
+
+    def recipe_update(self):
+        recipe_id = self.rng.choice(self.own_recipe_ids)
+        return ('PATCH', f'/api/recipes/{recipe_id}/',
+                self.get_recipe_data(), True)
+
+
+SCENARIOS = (
+    'recipes', 'recipes_anonymous', 'recipes_tags', 'recipes_author',
+    'recipes_favorited', 'recipes_popular', 'recipe_detail',
+    'subscriptions', 'ingredients_search', 'download_shopping_cart',
+    'recipe_create', 'recipe_update',
+)
+
+
+def send(port, app, token, method, path, data, authenticated):
+    """(секунд, статус, запросов к БД) одного запроса по HTTP"""
+    request_id = uuid.uuid4().hex
+    headers = {'X-Benchmark-Request': request_id}
+    body = None
+    if data is not None:
+        body = json.dumps(data).encode()
+        headers['Content-Type'] = 'application/json'
+    if authenticated:
+        headers['Authorization'] = f'Token {token}'
+    client = http.client.HTTPConnection('127.0.0.1', port)
+    started = time.perf_counter()
+    try:
+        client.request(method, quote(path, safe='/?=&'), body, headers)
+        response = client.getresponse()
+        response.read()
+    finally:
+        client.close()
+    elapsed = time.perf_counter() - started
+    return elapsed, response.status, app.pop_count(request_id)
+
+
+def summarize(results, wall_time):
+    timings = [elapsed * 1000 for elapsed, _, _ in results]
+    cuts = statistics.quantiles(timings, n=100, method='inclusive')
+    return {
+        'requests': len(results),
+        'errors': sum(status >= 400 for _, status, _ in results),
+        **{f'p{percentile}_ms': round(cuts[percentile - 1], 2)
+           for percentile in PERCENTILES},
+        'mean_ms': round(statistics.fmean(timings), 2),
+        'throughput_rps': round(len(results) / wall_time, 1),
+        'queries_per_request': round(
+            statistics.fmean(queries for _, _, queries in results), 2),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Замер задержек API на детерминированном наборе данных во '
+            'временной БД: p50/p95/p99, пропускная способность и '
+            'запросы к БД на запрос в формате JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ingredients', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=20,
+                            help='Запросов на сценарий до замера')
+        parser.add_argument('--scenario', action='append',
+                            choices=SCENARIOS, dest='scenarios',
+                            help='Сценарий, по умолчанию все')
+        parser.add_argument('--output', help='Файл для результата')
+        parser.add_argument(
+            '--baseline',
+            help='Результат прошлого замера: ошибка, если p95 или число '
+                 'запросов к БД выросли больше чем на '
+                 f'{MAX_REGRESSION:.0%}%')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 2:
+            raise CommandError('Нужно хотя бы 2 запроса на сценарий')
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+                CACHES={alias: {
+                    'BACKEND':
+                        'django.core.cache.backends.locmem.LocMemCache',
+                    'LOCATION': f'benchmark-{alias}'}
+                    for alias in settings.CACHES},
+                MEDIA_ROOT=os.path.join(directory, 'media'),
+                INGREDIENT_INDEX_PATH=os.path.join(directory, 'index.bin'),
+                SLOW_REQUEST_THRESHOLD_MS=float('inf'),
+                JOBS_EAGER=False):
+            if connection.vendor == 'sqlite':
+                # временная БД в файле: ее видят потоки сервера
+                connection.settings_dict['TEST']['NAME'] = os.path.join(
+                    directory, 'benchmark.sqlite3')
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False)
+            try:
+                report = self.run_benchmark(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        output = json.dumps(report, ensure_ascii=False, indent=2,
+                            sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
+        if options['baseline']:
+            self.compare(report, options['baseline'])
+
+    def run_benchmark(self, options):
+        dataset = seed_dataset(
+            users=options['users'], recipes=options['recipes'],
+            ingredients=options['ingredients'], seed=options['seed'])
+        build_index()
+        scenarios = Scenarios(random.Random(options['seed']))
+        server = ThreadedWSGIServer(
+            ('127.0.0.1', 0), QuietRequestHandler, allow_reuse_address=False)
+        app = QueryCountingApp(WSGIHandler())
+        server.set_app(app)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_address[1]
+        results = {}
+        try:
+            with ThreadPoolExecutor(options['concurrency']) as executor:
+                for name in options['scenarios'] or SCENARIOS:
+                    requests = [
+                        scenarios.get(name) for _ in range(
+                            options['warmup'] + options['requests'])]
+                    list(executor.map(
+                        lambda request: send(
+                            port, app, scenarios.token, *request),
+                        requests[:options['warmup']]))
+                    started = time.perf_counter()
+                    measured = list(executor.map(
+                        lambda request: send(
+                            port, app, scenarios.token, *request),
+                        requests[options['warmup']:]))
+                    results[name] = summarize(
+                        measured, time.perf_counter() - started)
+        finally:
+            server.shutdown()
+            server.server_close()
+        return {
+            'settings': {
+                'database': connection.vendor,
+                'dataset': dataset,
+                **{name: options[name] for name in (
+                    'users', 'recipes', 'ingredients', 'seed',
+                    'concurrency', 'requests', 'warmup')},
+            },
+            'scenarios': results,
+        }
+
+    def compare(self, report, path):
+        with open(path) as file:
+            baseline = json.load(file)['scenarios']
+        regressions = []
+        for name, result in report['scenarios'].items():
+            if name not in baseline:
+                continue
+            before = baseline[name]
+            change = result['p95_ms'] / before['p95_ms'] - 1
+            queries_limit = before['queries_per_request'] * (
+                1 + MAX_REGRESSION)
+            self.stderr.write(
+                f'{name}: p95 {before["p95_ms"]} -> {result["p95_ms"]} мс '
+                f'({change:+.0%}), запросов {before["queries_per_request"]}'
+                f' -> {result["queries_per_request"]}')
+            if (change > MAX_REGRESSION
+                    or result['queries_per_request'] > queries_limit):
+                regressions.append(name)
+        if regressions:
+            raise CommandError(
+                f'Замедлились сценарии: {", ".join(regressions)}')
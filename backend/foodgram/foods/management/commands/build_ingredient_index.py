@@ -0,0 +1,17 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from foods.ingredient_index import build_index
+
+
+class Command(BaseCommand):
+    help = 'Сборка файла индекса для поиска ингредиентов по названию'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = build_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Индекс {settings.INGREDIENT_INDEX_PATH}: {count} '
+            f'ингредиентов за {time.perf_counter() - started:.2f} с'))
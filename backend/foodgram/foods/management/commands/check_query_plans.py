@@ -0,0 +1,47 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import NotSupportedError
+
+from foods.diagnostics import explain, get_query_shapes
+from foods.models import Recipe, Tag
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Проверка планов частых запросов: ошибка, если запрос '
+            'просматривает таблицу целиком вместо индекса')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='Вывести планы всех запросов')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(subscribers__isnull=False).first()
+        author = Recipe.objects.values_list('author', flat=True).first()
+        if user is None or author is None:
+            raise CommandError(
+                'Нужна заполненная БД: рецепты и пользователь с подписками')
+        tag_slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+        shapes = get_query_shapes(
+            user, User.objects.get(id=author), tag_slugs)
+
+        failed = []
+        for name, queryset in shapes.items():
+            try:
+                lines, scans = explain(queryset)
+            except NotSupportedError as error:
+                raise CommandError(error)
+            if scans:
+                failed.append(name)
+                self.stdout.write(self.style.ERROR(
+                    f'{name}: полный просмотр {", ".join(scans)}'))
+            else:
+                self.stdout.write(f'{name}: OK')
+            if scans or options['verbose_plans']:
+                for line in lines:
+                    self.stdout.write(f'    {line}')
+        if failed:
+            raise CommandError(
+                f'Запросов с полным просмотром таблиц: {len(failed)}')
+        self.stdout.write(self.style.SUCCESS('Все планы используют индексы'))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from foods.services import (
+    RECIPE_COUNTERS, get_drifted_recipes, recount_recipe_counters
+)
+
+
+class Command(BaseCommand):
+    help = ('Сверка счетчиков избранного и списков покупок рецептов '
+            'с таблицами избранного и списков покупок')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Пересчитать счетчики рецептов с расхождениями')
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересчитать счетчики всех рецептов без сверки')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            updated = recount_recipe_counters()
+            self.stdout.write(self.style.SUCCESS(
+                f'Пересчитаны счетчики рецептов: {updated}'))
+            return
+
+        broken_recipe_ids = []
+        for recipe in get_drifted_recipes().iterator():
+            broken_recipe_ids.append(recipe.id)
+            for field in RECIPE_COUNTERS:
+                expected = getattr(recipe, f'actual_{field}')
+                actual = getattr(recipe, field)
+                if expected != actual:
+                    self.stdout.write(
+                        f'рецепт {recipe.id}, {field}: ожидается '
+                        f'{expected}, в таблице {actual}')
+
+        if not broken_recipe_ids:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+            return
+        if not options['fix']:
+            raise CommandError(
+                f'Расхождения у рецептов: {len(broken_recipe_ids)}')
+        recount_recipe_counters(broken_recipe_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитаны счетчики рецептов: {len(broken_recipe_ids)}'))
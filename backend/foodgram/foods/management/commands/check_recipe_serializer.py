@@ -0,0 +1,52 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from foods.diagnostics import render_pair, seed_edge_cases
+from foods.models import Recipe
+
+BATCH_SIZE = 100
+
+
+class Command(BaseCommand):
+    help = ('Сверка JSON RecipeReadSerializer и RecipeSerializer '
+            'побайтно: для анонимного пользователя и для пользователя '
+            'с избранным, списком покупок и подписками. Пограничные '
+            'случаи создаются внутри транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=1000,
+            help='Последних рецептов для сверки, 0 - все')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = seed_edge_cases()
+            recipe_ids = Recipe.objects.values_list('id', flat=True)
+            if options['limit']:
+                recipe_ids = recipe_ids[:options['limit']]
+            recipe_ids = list(recipe_ids)
+            mismatches = checked = 0
+            for viewer in (AnonymousUser(), user):
+                for start in range(0, len(recipe_ids), BATCH_SIZE):
+                    batch = recipe_ids[start:start + BATCH_SIZE]
+                    pairs = render_pair(batch, viewer)
+                    if len(pairs) != len(batch):
+                        raise CommandError(
+                            f'Рецептов в ответе: {len(pairs)} '
+                            f'вместо {len(batch)}')
+                    for recipe_id, expected, actual in pairs:
+                        checked += 1
+                        if expected != actual:
+                            mismatches += 1
+                            self.stdout.write(self.style.ERROR(
+                                f'рецепт {recipe_id}, {viewer}:\n'
+                                f'    ожидается {expected.decode()}\n'
+                                f'    получено  {actual.decode()}'))
+            transaction.set_rollback(True)
+
+        if mismatches:
+            raise CommandError(
+                f'Расхождений: {mismatches} из {checked}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Совпадают все ответы: {checked}'))
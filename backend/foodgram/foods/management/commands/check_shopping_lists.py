@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from foods.services import calculate_shopping_lists, rebuild_shopping_lists
+from users.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = ('Сверка сводных списков покупок с пересчетом по спискам '
+            'покупок пользователей')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Пересобрать списки пользователей с расхождениями')
+
+    def handle(self, *args, **options):
+        expected = calculate_shopping_lists()
+        actual = {}
+        for user_id, ingredient_id, amount in (
+                ShoppingListItem.objects.values_list(
+                    'current_user_id', 'ingredient_id', 'amount'
+                ).iterator()):
+            actual.setdefault(user_id, {})[ingredient_id] = amount
+
+        broken_user_ids = []
+        for user_id in sorted({*expected, *actual}):
+            expected_amounts = expected.get(user_id, {})
+            actual_amounts = actual.get(user_id, {})
+            if expected_amounts == actual_amounts:
+                continue
+            broken_user_ids.append(user_id)
+            for ingredient_id in sorted(
+                    {*expected_amounts, *actual_amounts}):
+                expected_amount = expected_amounts.get(ingredient_id)
+                actual_amount = actual_amounts.get(ingredient_id)
+                if expected_amount != actual_amount:
+                    self.stdout.write(
+                        f'пользователь {user_id}, ингредиент '
+                        f'{ingredient_id}: ожидается {expected_amount}, '
+                        f'в таблице {actual_amount}')
+
+        if not broken_user_ids:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+            return
+        if not options['fix']:
+            raise CommandError(
+                f'Расхождения у пользователей: {len(broken_user_ids)}')
+        rebuild_shopping_lists(broken_user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобраны списки пользователей: {len(broken_user_ids)}'))
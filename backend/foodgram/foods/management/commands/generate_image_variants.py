@@ -0,0 +1,68 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from foods.image_variants import SOURCE_KEY, make_variants, save_variants
+from foods.models import Recipe
+
+
+def make_recipe_variants(recipe_id, image_name):
+    """Выполняется в отдельном процессе"""
+    image = Recipe(id=recipe_id, image=image_name).image
+    try:
+        return recipe_id, make_variants(image), None
+    except Exception as error:
+        return recipe_id, None, f'{image_name}: {error}'
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ('Создание уменьшенных копий картинок рецептов, '
+            'загруженных до их появления')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов, по умолчанию по числу ядер')
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать копии и для рецептов, у которых они уже есть')
+
+    def handle(self, *args, **options):
+        recipes = [
+            (recipe_id, image, variants)
+            for recipe_id, image, variants in Recipe.objects.exclude(
+                image='').values_list('id', 'image', 'image_variants')
+            if options['all'] or (variants or {}).get(SOURCE_KEY) != image
+        ]
+        if not recipes:
+            self.stdout.write(self.style.SUCCESS('Все копии уже созданы'))
+            return
+
+        # дочерние процессы открывают собственные соединения с БД
+        connections.close_all()
+        done = failed = 0
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=options['workers'],
+                                 initializer=django.setup) as executor:
+            futures = [
+                executor.submit(make_recipe_variants, recipe_id, image)
+                for recipe_id, image, _ in recipes
+            ]
+            for future in as_completed(futures):
+                recipe_id, variants, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f'рецепт {recipe_id}: {error}')
+                    continue
+                save_variants(recipe_id, variants)
+                done += 1
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано копий: {done}, ошибок: {failed}, '
+            f'{elapsed:.1f} с'))
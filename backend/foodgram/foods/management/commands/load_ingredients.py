@@ -0,0 +1,95 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from foods.ingredient_index import build_index
+from foods.services import insert_ingredients
+
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(path):
+    """Строки вида "название,единица измерения" """
+    with open(path, encoding='utf-8', newline='') as csv_file:
+        for row in csv.reader(csv_file):
+            if len(row) >= 2:
+                yield row[0], row[1]
+
+
+def read_json(path):
+    """Объекты массива [{"name": ..., "measurement_unit": ...}, ...]
+    разбираются по одному, файл целиком в память не загружается"""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as json_file:
+        buffer, position, finished = '', 0, False
+        while True:
+            # пропускаем пробелы и разделители массива
+            while position < len(buffer) and buffer[position] in ' \t\r\n[,':
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if finished:
+                    if buffer[position:].strip():
+                        raise
+                    return
+                chunk = json_file.read(JSON_CHUNK_SIZE)
+                finished = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield item['name'], item['measurement_unit']
+
+
+class Command(BaseCommand):
+    help = ('Загрузка ингредиентов из csv или json файла, '
+            'уже существующие ингредиенты пропускаются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к ingredients.csv/.json')
+        parser.add_argument('--format', choices=('csv', 'json'))
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден')
+        file_format = (
+            options['format'] or os.path.splitext(path)[1].lstrip('.'))
+        readers = {'csv': read_csv, 'json': read_json}
+        if file_format not in readers:
+            raise CommandError('Поддерживаются форматы csv и json')
+
+        rows = (
+            (title.strip(), unit.strip())
+            for title, unit in readers[file_format](path)
+            if title.strip()
+        )
+        units = {}
+        created = skipped = 0
+        started = time.perf_counter()
+        while True:
+            batch = list(islice(rows, options['batch_size']))
+            if not batch:
+                break
+            with transaction.atomic():
+                batch_created, batch_skipped = insert_ingredients(
+                    batch, units)
+            created += batch_created
+            skipped += batch_skipped
+        elapsed = time.perf_counter() - started
+
+        if created:
+            # bulk_create не отправляет сигналы, индекс собираем сами
+            build_index()
+        total = created + skipped
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: {created}, пропущено: {skipped}, '
+            f'{total / elapsed if elapsed else total:.0f} строк/с'))
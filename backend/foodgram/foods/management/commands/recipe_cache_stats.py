@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from foods.page_cache import HIT, MISS, get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Статистика кэша страниц списка рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить счетчики')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Счетчики обнулены'))
+            return
+        stats = get_stats()
+        for outcome, (count, average) in stats.items():
+            self.stdout.write(
+                f'{outcome}: {count}, в среднем {average:.2f} мс')
+        (hits, hit_time), (misses, miss_time) = stats[HIT], stats[MISS]
+        if hits + misses:
+            self.stdout.write(
+                f'Доля попаданий: {hits / (hits + misses):.1%}, '
+                f'попадание быстрее промаха на {miss_time - hit_time:.2f} мс')
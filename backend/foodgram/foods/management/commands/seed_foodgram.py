@@ -0,0 +1,52 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from foods.models import Recipe
+from foods.seeding import seed_dataset
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Заполнение БД большим детерминированным набором данных: '
+            'пользователи, рецепты, избранное, списки покупок и подписки '
+            'с реалистичными распределениями')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument(
+            '--ingredients', type=int, default=2000,
+            help='Ингредиентов, если каталог еще не загружен')
+        parser.add_argument('--images', type=int, default=4,
+                            help='Картинок-заглушек на все рецепты')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if min(options['users'], options['recipes'], options['images']) < 1:
+            raise CommandError(
+                'Нужны хотя бы один пользователь, рецепт и картинка')
+        if Recipe.objects.exists() or User.objects.filter(
+                username='user0').exists():
+            raise CommandError(
+                'В БД уже есть рецепты или пользователи набора, '
+                'заполнять можно только пустую БД')
+
+        def progress(model, count, elapsed):
+            self.stdout.write(
+                f'{model._meta.label}: {count} строк за {elapsed:.1f} с')
+
+        started = time.perf_counter()
+        created = seed_dataset(
+            users=options['users'], recipes=options['recipes'],
+            ingredients=options['ingredients'], images=options['images'],
+            seed=options['seed'], progress=progress)
+        elapsed = time.perf_counter() - started
+        rows = sum(created.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано строк: {rows} за {elapsed:.1f} с '
+            f'({rows / elapsed * 60:,.0f} строк в минуту, '
+            f'{connection.vendor})'))
@@ -0,0 +1,18 @@
+# Generated by Django 4.1 on 2026-10-18 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foods', '0009_rename_favoritedrecipesbyuser_favoritedrecipebyuser'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Ссылки на копии картинки разных размеров, заполняются после загрузки картинки', verbose_name='Уменьшенные копии картинки'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.1 on 2026-10-18 18:30
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('foods', 'Recipe')
+    counted = {
+        'favorites_count': apps.get_model('foods', 'FavoritedRecipeByUser'),
+        'in_carts_count': apps.get_model('users', 'ShoppingCartByUser'),
+    }
+    Recipe.objects.update(**{
+        field: Coalesce(models.Subquery(
+            model.objects.filter(recipe=models.OuterRef('pk')).order_by()
+            .values('recipe').annotate(total=models.Count('pk'))
+            .values('total')), 0)
+        for field, model in counted.items()
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foods', '0011_recipe_list_indexes'),
+        ('users', '0005_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Поддерживается при добавлении и удалении из избранного', verbose_name='Добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Поддерживается при добавлении и удалении из списков покупок', verbose_name='Добавлений в список покупок'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date', '-id'], name='recipe_popular_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 
 User = get_user_model()
 
@@ -62,6 +64,75 @@ class Ingredient(models.Model):
         return self.title
 
 
+class UnicodeLower(models.Func):
+    """LOWER для любых букв, а не только латиницы: встроенная LOWER
+    в SQLite меняет регистр только ASCII, там вызывается функция Python,
+    зарегистрированная для соединения (foods.signals)"""
+
+    function = 'LOWER'
+    output_field = models.CharField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, function='UNICODE_LOWER', **extra_context)
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Выборки рецептов для отдачи через RecipeSerializer"""
+
+    def with_related(self):
+        """Автор, теги и ингредиенты с единицами измерения
+        загружаются фиксированным числом запросов. Теги и ингредиенты
+        упорядочены по id, как в RecipeReadSerializer"""
+        return self.select_related('author').prefetch_related(
+            models.Prefetch('tags', queryset=Tag.objects.order_by('id')),
+            models.Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related(
+                    'recipe_ingredients__measurement_unit').order_by('id')
+            )
+        )
+
+    def with_user_flags(self, user):
+        """Признаки is_favorited и is_in_shopping_cart
+        вычисляются в том же запросе через EXISTS"""
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=models.Value(False),
+                is_in_shopping_cart=models.Value(False)
+            )
+        # импорт внутри метода: users.models импортирует foods.models
+        from users.models import ShoppingCartByUser
+
+        return self.annotate(
+            is_favorited=models.Exists(
+                FavoritedRecipeByUser.objects.filter(
+                    recipe=models.OuterRef('pk'), current_user=user)),
+            is_in_shopping_cart=models.Exists(
+                ShoppingCartByUser.objects.filter(
+                    recipe=models.OuterRef('pk'), current_user=user))
+        )
+
+    def top_per_author(self, limit):
+        """Не более limit последних рецептов каждого автора.
+        Нумерация внутри автора считается оконной функцией ROW_NUMBER,
+        поэтому выборка для всех авторов делается одним запросом."""
+        ranked = self.annotate(
+            recipe_rank=models.Window(
+                expression=RowNumber(),
+                partition_by=models.F('author'),
+                order_by=(models.F('pub_date').desc(),
+                          models.F('id').desc())
+            )
+        ).order_by().values('id', 'recipe_rank')
+        sql, params = ranked.query.sql_with_params()
+        return self.model.objects.filter(id__in=RawSQL(
+            f'SELECT ranked.id FROM ({sql}) ranked '
+            'WHERE ranked.recipe_rank <= %s',
+            (*params, limit)
+        ))
+
+
 class Recipe(models.Model):
     """Рецепты"""
 
@@ -77,6 +148,14 @@ class Recipe(models.Model):
         'Картинка',
         upload_to='foods_images/',
     )
+    image_variants = models.JSONField(
+        'Уменьшенные копии картинки',
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text='Ссылки на копии картинки разных размеров, '
+                  'заполняются после загрузки картинки',
+    )
     tags = models.ManyToManyField(
         Tag, related_name='recipes', verbose_name='Тег')
     ingredient = models.ManyToManyField(
@@ -89,11 +168,40 @@ class Recipe(models.Model):
         help_text='Время приготовления в минутах',
     )
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное',
+        default=0,
+        editable=False,
+        help_text='Поддерживается при добавлении и удалении из избранного',
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'Добавлений в список покупок',
+        default=0,
+        editable=False,
+        help_text='Поддерживается при добавлении и удалении '
+                  'из списков покупок',
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ('-pub_date',)
+        # id - для однозначного порядка рецептов с одинаковой датой
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            # списки рецептов и постраничный вывод по курсору
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'),
+            # фильтр ?author=, рецепты в подписках (top_per_author)
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'),
+            # сортировка ?ordering=popular
+            models.Index(
+                fields=['-favorites_count', '-pub_date', '-id'],
+                name='recipe_popular_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -0,0 +1,181 @@
+"""Общий кэш страниц списка рецептов.
+
+Страница списка почти не зависит от пользователя: различаются только
+is_favorited, is_in_shopping_cart и author.is_subscribed. В кэше
+хранится страница с этими признаками, сброшенными в False, ключ
+включает параметры страницы и фильтров и версии всех моделей, данные
+которых попадают в ответ, поэтому любая запись рецепта, тега,
+ингредиента или пользователя делает старые страницы недоступными.
+Аутентифицированному пользователю его признаки накладываются на
+страницу из кэша одним запросом.
+"""
+import fcntl
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db.models import Exists, OuterRef
+from rest_framework.response import Response
+
+from .cache import get_label, get_versions
+from .models import Ingredient, MeasurementUnit, Recipe, Tag
+from users.models import SubscribersByCurrentUser
+
+User = get_user_model()
+
+PAGE_KEY = 'foodgram:recipes:page:{}'
+STATS_KEY = 'foodgram:recipes:stats:{}:{}'
+# страницы вытесняются отдельно от версий, токенов и статистики
+PAGES_CACHE = 'pages'
+HIT, MISS, BYPASS = 'HIT', 'MISS', 'BYPASS'
+OUTCOMES = (HIT, MISS, BYPASS)
+PAGE_MODELS = (Recipe, Tag, Ingredient, MeasurementUnit, User)
+CACHED_PARAMS = ('page', 'limit', 'tags', 'author', 'pagination', 'cursor')
+# фильтры, которые со значением "ложь" не меняют выборку
+USER_FILTERS = ('is_favorited', 'is_in_shopping_cart')
+FALSE_VALUES = ('', '0', 'false', 'False')
+
+
+def get_page_params(request):
+    """Нормализованные параметры страницы или None, если ответ
+    зависит от пользователя и кэшировать его нельзя"""
+    params = []
+    for name, values in request.query_params.lists():
+        if name in USER_FILTERS:
+            if any(value not in FALSE_VALUES for value in values):
+                return None
+            continue
+        if name not in CACHED_PARAMS or (
+                name == 'author' and 'me' in values):
+            return None
+        params.append((name, tuple(sorted(set(values)))))
+    return tuple(sorted(params))
+
+
+def get_page_key(request, params):
+    versions = get_versions(*(get_label(model) for model in PAGE_MODELS))
+    state = repr((request.build_absolute_uri(request.path), params,
+                  sorted(versions.items())))
+    return PAGE_KEY.format(hashlib.md5(state.encode()).hexdigest())
+
+
+def replace_user_flags(data, flags):
+    """Копия страницы с признаками пользователя из flags
+    {id рецепта: (is_favorited, is_in_shopping_cart, is_subscribed)}"""
+    results = []
+    for item in data['results']:
+        favorited, in_cart, subscribed = flags.get(
+            item['id'], (False, False, False))
+        results.append({
+            **item,
+            'author': {**item['author'], 'is_subscribed': subscribed},
+            'is_favorited': favorited,
+            'is_in_shopping_cart': in_cart,
+        })
+    return {**data, 'results': results}
+
+
+def get_user_flags(user, recipe_ids):
+    """Признаки пользователя для рецептов страницы одним запросом"""
+    recipes = Recipe.objects.filter(id__in=recipe_ids).with_user_flags(
+        user).annotate(is_subscribed=Exists(
+            SubscribersByCurrentUser.objects.filter(
+                current_user=user, subscription=OuterRef('author_id'))))
+    return {
+        recipe_id: (favorited, in_cart, subscribed)
+        for recipe_id, favorited, in_cart, subscribed in recipes.values_list(
+            'id', 'is_favorited', 'is_in_shopping_cart', 'is_subscribed'
+        ).order_by()
+    }
+
+
+@contextmanager
+def stats_lock():
+    """Блокировка между процессами для файлового кэша: его add и incr
+    читают и записывают файл без блокировки, и одновременные
+    обращения теряли бы приращения. У Redis, Memcached и кэша в
+    памяти incr атомарен."""
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    if not isinstance(backend, FileBasedCache):
+        yield
+        return
+    os.makedirs(backend._dir, exist_ok=True)
+    # файлы без расширения .djcache кэш не считает и не удаляет
+    with open(os.path.join(backend._dir, 'stats.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def record_outcome(outcome, elapsed):
+    """Счетчики обращений и суммарного времени ответа, в микросекундах"""
+    with stats_lock():
+        for name, value in (('count', 1), ('time', int(elapsed * 1e6))):
+            key = STATS_KEY.format(outcome, name)
+            if not cache.add(key, value, timeout=None):
+                try:
+                    cache.incr(key, value)
+                except ValueError:
+                    cache.set(key, value, timeout=None)
+
+
+def get_stats():
+    """{исход: (обращений, среднее время ответа в мс)}"""
+    keys = [STATS_KEY.format(outcome, name)
+            for outcome in OUTCOMES for name in ('count', 'time')]
+    values = cache.get_many(keys)
+    stats = {}
+    for outcome in OUTCOMES:
+        count = values.get(STATS_KEY.format(outcome, 'count'), 0)
+        total = values.get(STATS_KEY.format(outcome, 'time'), 0)
+        stats[outcome] = (count, total / count / 1000 if count else 0.0)
+    return stats
+
+
+def reset_stats():
+    cache.delete_many([STATS_KEY.format(outcome, name)
+                       for outcome in OUTCOMES for name in ('count', 'time')])
+
+
+class RecipePageCacheMixin:
+    """Список рецептов из общего кэша страниц, заголовок X-Cache
+    показывает исход: HIT, MISS или BYPASS"""
+
+    def list(self, request, *args, **kwargs):
+        started = time.perf_counter()
+        params = get_page_params(request)
+        if params is None:
+            response = super().list(request, *args, **kwargs)
+            outcome = BYPASS
+        else:
+            response, outcome = self.get_cached_page(
+                request, params, *args, **kwargs)
+        response['X-Cache'] = outcome
+        record_outcome(outcome, time.perf_counter() - started)
+        return response
+
+    def get_cached_page(self, request, params, *args, **kwargs):
+        key = get_page_key(request, params)
+        pages = caches[PAGES_CACHE]
+        data = pages.get(key)
+        user = request.user
+        if data is not None:
+            if user.is_authenticated and data['results']:
+                data = replace_user_flags(data, get_user_flags(
+                    user, [item['id'] for item in data['results']]))
+            return Response(data), HIT
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            data = response.data
+            if user.is_authenticated:
+                data = replace_user_flags(data, {})
+            pages.set(key, data, settings.RECIPE_PAGE_CACHE_TIMEOUT)
+        return response, MISS
@@ -1,5 +1,243 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import hashlib
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .cache import get_label, get_versions
+from .models import FavoritedRecipeByUser, Recipe, Tag
+from users.models import ShoppingCartByUser, SubscribersByCurrentUser
+
+User = get_user_model()
+
+COUNT_KEY = 'foodgram:count:{}'
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+def estimate_count(queryset):
+    """Оценка числа строк планировщиком PostgreSQL или None"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+            # -1: таблица еще не анализировалась
+            return int(row[0]) if row and row[0] >= 0 else None
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CachedCountPaginator(Paginator):
+    """Количество объектов берется из кэша по SQL запроса и версиям
+    моделей count_models. Большие выборки на PostgreSQL считаются
+    по оценке планировщика, count_exact показывает, точное ли число."""
+
+    def __init__(self, object_list, per_page, count_models=(), **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_models = count_models
+        self.count_exact = True
+
+    @cached_property
+    def count(self):
+        # признаки пользователя в аннотациях для подсчета не нужны
+        queryset = self.object_list.values('pk')
+        sql, params = queryset.query.sql_with_params()
+        versions = get_versions(
+            *(get_label(model) for model in self.count_models))
+        state = repr((queryset.db, sql, params, sorted(versions.items())))
+        key = COUNT_KEY.format(hashlib.md5(state.encode()).hexdigest())
+        cached = cache.get(key)
+        if cached is None:
+            estimate = estimate_count(queryset)
+            if (estimate is not None
+                    and estimate >= settings.COUNT_ESTIMATE_THRESHOLD):
+                cached = (estimate, False)
+            else:
+                cached = (queryset.count(), True)
+            cache.set(key, cached, settings.COUNT_CACHE_TIMEOUT)
+        count, self.count_exact = cached
+        return count
+
+
+class CachedCountPagination(CustomPageNumberPagination):
+    """Постраничный вывод с кэшированным количеством объектов"""
+
+    count_models = ()
+
+    def django_paginator_class(self, object_list, per_page):
+        return CachedCountPaginator(
+            object_list, per_page, count_models=self.count_models)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.page.paginator.count,
+            'count_exact': self.page.paginator.count_exact,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class KeysetPagination(BasePagination):
+    """Постраничный вывод по курсору: страница выбирается условием
+    на поля сортировки последнего показанного объекта, без OFFSET
+    и без подсчета общего количества. Курсор - закодированные значения
+    полей сортировки и направление."""
+
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def __init__(self, ordering):
+        # последнее поле сортировки должно быть уникальным
+        self.ordering = ordering
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param, '')
+        if value.isdigit() and int(value) > 0:
+            return min(int(value), self.max_page_size)
+        return self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request, queryset.model)
+        fields = [
+            (name.lstrip('-'), name.startswith('-') != reverse)
+            for name in self.ordering
+        ]
+        queryset = queryset.order_by(*(
+            f'-{name}' if descending else name
+            for name, descending in fields))
+        if position is not None:
+            queryset = queryset.filter(get_after_filter(fields, position))
+
+        page = list(queryset[:page_size + 1])
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if reverse:
+            page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.page = page
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_link(self.page[-1:], False, self.has_next),
+            'previous': self.get_link(
+                self.page[:1], True, self.has_previous),
+            'results': data,
+        })
+
+    def get_link(self, objects, reverse, exists):
+        if not objects or not exists:
+            return None
+        values = [
+            getattr(objects[0], name.lstrip('-')) for name in self.ordering]
+        cursor = base64.urlsafe_b64encode(json.dumps(
+            [[str(value) for value in values], reverse]).encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        """(значения полей сортировки, направление назад) из курсора"""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            values, reverse = json.loads(
+                base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = [
+                model._meta.get_field(name.lstrip('-')).to_python(value)
+                for name, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(reverse)
+
+
+def get_after_filter(fields, position):
+    """Условие "строго после position" для сортировки fields
+    [(поле, по убыванию)]: (a, b) после (x, y), если a > x
+    или a = x и b > y"""
+    after = Q()
+    for number, (name, descending) in enumerate(fields):
+        condition = Q(**{
+            f'{name}__{"lt" if descending else "gt"}': position[number]})
+        for (previous_name, _), value in zip(fields, position[:number]):
+            condition &= Q(**{previous_name: value})
+        after |= condition
+    return after
+
+
+class KeysetOptInMixin:
+    """Постраничный вывод по курсору для запросов с ?pagination=cursor
+    или ?cursor=..., без них - по номеру страницы, как раньше.
+    Курсор строится по явной сортировке queryset, если она задана
+    (например, фильтром), иначе по keyset_ordering"""
+
+    keyset_ordering = ('-pub_date', '-id')
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if (params.get('pagination') == 'cursor'
+                or KeysetPagination.cursor_query_param in params):
+            self.keyset = KeysetPagination(
+                tuple(queryset.query.order_by) or self.keyset_ordering)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+RECIPE_COUNT_MODELS = (Recipe, Tag, FavoritedRecipeByUser, ShoppingCartByUser)
+
+
+class RecipePagination(KeysetOptInMixin, CachedCountPagination):
+    count_models = RECIPE_COUNT_MODELS
+
+
+class FavoritePagination(KeysetOptInMixin, CachedCountPagination):
+    # страница избранного задается только номером, без limit
+    page_size_query_param = None
+    count_models = RECIPE_COUNT_MODELS
+
+
+class SubscriptionPagination(KeysetOptInMixin, CachedCountPagination):
+    keyset_ordering = ('id',)
+    count_models = (User, SubscribersByCurrentUser)
@@ -10,4 +10,5 @@ class OwnerOrReadOnly(permissions.BasePermission):
         )
 
     def has_object_permission(self, request, view, obj):
-        return obj.author == request.user
+        # по id: без запроса автора рецепта
+        return obj.author_id == request.user.id
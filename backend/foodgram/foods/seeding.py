@@ -0,0 +1,296 @@
+"""Детерминированный набор данных для замеров производительности.
+
+Одинаковые параметры и seed дают одинаковые данные, поэтому замеры
+на разных коммитах можно сравнивать между собой. Распределения близки
+к рабочим: немногие авторы пишут большую часть рецептов, немногие
+рецепты собирают большую часть избранного, а авторы - подписчиков
+(степенной закон), частые ингредиенты и теги встречаются в большинстве
+рецептов.
+
+Строки пишутся пакетами с заранее назначенными id, без моделей и
+сигналов: COPY на PostgreSQL, executemany на остальных БД. Счетчики
+рецептов, сводные списки покупок и версии кэша обновляются в конце.
+Картинки рецептов - несколько заглушек с готовыми копиями на все рецепты.
+"""
+import csv
+import io
+import json
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+from PIL import Image
+
+from .cache import bump_versions
+from .image_variants import make_variants
+from .models import (
+    FavoritedRecipeByUser, Ingredient, MeasurementUnit, Recipe,
+    RecipeIngredient, Tag
+)
+from .services import get_actual_counters
+from users.models import (
+    ShoppingCartByUser, ShoppingListItem, SubscribersByCurrentUser
+)
+
+User = get_user_model()
+
+SEED_PASSWORD = 'foodgram-seed'
+PLACEHOLDER_NAME = 'foods_images/seed/placeholder_{}.jpg'
+PLACEHOLDER_COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F2C94C',
+                      '#2D9CDB', '#EB5757', '#6FCF97', '#BB6BD9')
+UNITS = ('г', 'кг', 'мл', 'л', 'шт', 'ст. л.', 'ч. л.', 'стакан',
+         'щепотка', 'по вкусу')
+WORDS = ('мука', 'сахар', 'соль', 'молоко', 'яйцо', 'масло', 'перец',
+         'лук', 'морковь', 'картофель', 'сыр', 'томат', 'чеснок', 'рис',
+         'курица', 'говядина', 'рыба', 'яблоко', 'лимон', 'укроп')
+TAGS = (('Завтрак', 'breakfast', '#E26C2D'), ('Обед', 'lunch', '#49B64E'),
+        ('Ужин', 'dinner', '#8775D2'), ('Десерт', 'dessert', '#F2C94C'),
+        ('Суп', 'soup', '#2D9CDB'), ('Салат', 'salad', '#27AE60'))
+BATCH_SIZE = 10000
+# показатели степенных законов: чем больше, тем сильнее перекос
+AUTHOR_EXPONENT = 1.1
+INGREDIENT_EXPONENT = 0.9
+RECIPE_EXPONENT = 1.0
+# у первого пользователя всегда есть избранное, список покупок
+# и подписки: от его имени идут замеры
+ACTIVE_USER_LIMITS = {'favorites': 20, 'carts': 10, 'subscriptions': 20}
+
+
+def get_cum_weights(count, exponent):
+    """Накопленные веса закона Ципфа для рангов 1..count"""
+    return list(accumulate(1 / rank ** exponent
+                           for rank in range(1, count + 1)))
+
+
+def sample_weighted(rng, population, cum_weights, count):
+    """count разных элементов population с весами cum_weights"""
+    count = min(count, len(population))
+    chosen = set()
+    while len(chosen) < count:
+        chosen.update(rng.choices(
+            population, cum_weights=cum_weights, k=count - len(chosen)))
+    return sorted(chosen)
+
+
+def get_power_law_count(rng, alpha, limit):
+    """Количество с тяжелым хвостом: у большинства 0-2, у немногих
+    сотни"""
+    return min(int(rng.paretovariate(alpha)) - 1, limit)
+
+
+def generate_relations(rng, user_ids, alpha, limit, key, population,
+                       weights):
+    """Пары (пользователь, объект): количество у пользователя - по
+    степенному закону, объекты - с весами weights"""
+    for number, user_id in enumerate(user_ids):
+        count = get_power_law_count(rng, alpha, limit)
+        if number == 0:
+            count = ACTIVE_USER_LIMITS[key]
+        for target_id in sample_weighted(rng, population, weights, count):
+            if target_id != user_id:
+                yield user_id, target_id
+
+
+def insert_rows(model, fields, rows):
+    """Пакетная вставка кортежей значений полей fields,
+    возвращает количество строк"""
+    opts = model._meta
+    quote = connection.ops.quote_name
+    table = quote(opts.db_table)
+    columns = ', '.join(
+        quote(opts.get_field(name).column) for name in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    rows = iter(rows)
+    count = 0
+    with connection.cursor() as cursor:
+        for batch in iter(lambda: list(islice(rows, BATCH_SIZE)), []):
+            if connection.vendor == 'postgresql':
+                buffer = io.StringIO()
+                # строки в кавычках: пустая строка не станет NULL
+                csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(
+                    batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f'COPY {table} ({columns}) FROM STDIN '
+                    'WITH (FORMAT csv)', buffer)
+            else:
+                cursor.executemany(
+                    f'INSERT INTO {table} ({columns}) '
+                    f'VALUES ({placeholders})', batch)
+            count += len(batch)
+    return count
+
+
+def get_next_id(model):
+    return (model.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+
+
+def get_placeholder_images(count):
+    """[(имя файла, копии в JSON)] картинок-заглушек, файлы и копии
+    создаются один раз"""
+    images = []
+    for number in range(count):
+        name = PLACEHOLDER_NAME.format(number)
+        if not default_storage.exists(name):
+            buffer = io.BytesIO()
+            Image.new(
+                'RGB', (1280, 960),
+                PLACEHOLDER_COLORS[number % len(PLACEHOLDER_COLORS)]
+            ).save(buffer, 'JPEG', quality=80)
+            name = default_storage.save(name, ContentFile(buffer.getvalue()))
+        variants = make_variants(Recipe(image=name).image)
+        images.append((name, json.dumps(variants)))
+    return images
+
+
+def seed_dataset(users=200, recipes=2000, ingredients=1000, images=4,
+                 seed=0, progress=None):
+    """Создает набор данных, возвращает {модель: создано строк}.
+    Если каталог ингредиентов уже загружен, рецепты составляются из
+    него, иначе создается ingredients ингредиентов. progress(модель,
+    строк, секунд) вызывается после каждой таблицы."""
+    rng = random.Random(seed)
+    adapt_datetime = connection.ops.adapt_datetimefield_value
+    created = {}
+
+    def insert(model, fields, rows):
+        started = time.perf_counter()
+        count = insert_rows(model, fields, rows)
+        created[model._meta.label] = count
+        if progress is not None:
+            progress(model, count, time.perf_counter() - started)
+
+    with transaction.atomic():
+        units = [MeasurementUnit.objects.get_or_create(title=title)[0].id
+                 for title in UNITS]
+        tag_ids = [Tag.objects.get_or_create(
+            slug=slug, defaults={'name': name, 'color': color})[0].id
+            for name, slug, color in TAGS]
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True))
+        if not ingredient_ids:
+            first_ingredient_id = get_next_id(Ingredient)
+            insert(Ingredient, ('id', 'title', 'measurement_unit'), (
+                (first_ingredient_id + number,
+                 f'{WORDS[number % len(WORDS)]} {number // len(WORDS)}',
+                 rng.choice(units))
+                for number in range(ingredients)))
+            ingredient_ids = list(range(
+                first_ingredient_id, first_ingredient_id + ingredients))
+        images = get_placeholder_images(images)
+        now = timezone.now()
+
+        first_user_id = get_next_id(User)
+        user_ids = range(first_user_id, first_user_id + users)
+        password = make_password(SEED_PASSWORD)
+        insert(User, (
+            'id', 'username', 'email', 'first_name', 'last_name',
+            'password', 'is_staff', 'is_superuser', 'is_active',
+            'date_joined'), (
+            (user_id, f'user{number}', f'user{number}@example.com',
+             f'Имя {number}', f'Фамилия {number}', password,
+             False, False, True,
+             adapt_datetime(now - timedelta(days=730 - number * 730 // users)))
+            for number, user_id in enumerate(user_ids)))
+
+        # авторы по убыванию плодовитости: первый пользователь - самый
+        # активный автор
+        author_weights = get_cum_weights(users, AUTHOR_EXPONENT)
+        first_recipe_id = get_next_id(Recipe)
+        recipe_ids = range(first_recipe_id, first_recipe_id + recipes)
+        insert(Recipe, (
+            'id', 'author', 'title', 'description', 'image',
+            'image_variants', 'time', 'pub_date', 'favorites_count',
+            'in_carts_count'), (
+            (recipe_id,
+             rng.choices(user_ids, cum_weights=author_weights)[0],
+             f'Рецепт {number}', f'Описание рецепта {number}',
+             *images[number % len(images)],
+             max(1, min(int(rng.lognormvariate(3.4, 0.6)), 600)),
+             adapt_datetime(now - timedelta(
+                 minutes=(recipes - number) * 1051200 // recipes)),
+             0, 0)
+            for number, recipe_id in enumerate(recipe_ids)))
+
+        # частые ингредиенты - случайные из каталога, а не первые по id
+        popular_ingredients = rng.sample(ingredient_ids, len(ingredient_ids))
+        ingredient_weights = get_cum_weights(
+            len(popular_ingredients), INGREDIENT_EXPONENT)
+        insert(RecipeIngredient, ('recipe', 'recipe_ingredients', 'amount'), (
+            (recipe_id, ingredient_id, rng.randint(1, 500))
+            for recipe_id in recipe_ids
+            for ingredient_id in sample_weighted(
+                rng, popular_ingredients, ingredient_weights,
+                max(1, min(round(rng.lognormvariate(2.0, 0.4)), 25)))))
+        tag_weights = get_cum_weights(len(tag_ids), 1.0)
+        insert(Recipe.tags.through, ('recipe', 'tag'), (
+            (recipe_id, tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in sample_weighted(
+                rng, tag_ids, tag_weights,
+                rng.choices((1, 2, 3), weights=(5, 3, 1))[0])))
+
+        popular_recipes = rng.sample(recipe_ids, len(recipe_ids))
+        recipe_weights = get_cum_weights(recipes, RECIPE_EXPONENT)
+
+        insert(FavoritedRecipeByUser, ('current_user', 'recipe'),
+               generate_relations(rng, user_ids, 1.2, 500, 'favorites',
+                                  popular_recipes, recipe_weights))
+        insert(ShoppingCartByUser, ('current_user', 'recipe'),
+               generate_relations(rng, user_ids, 1.5, 50, 'carts',
+                                  popular_recipes, recipe_weights))
+        insert(SubscribersByCurrentUser, ('current_user', 'subscription'),
+               generate_relations(rng, user_ids, 1.3, 200, 'subscriptions',
+                                  user_ids, author_weights))
+
+        started = time.perf_counter()
+        created[ShoppingListItem._meta.label] = fill_seeded_aggregates(
+            first_user_id, first_recipe_id)
+        if progress is not None:
+            progress(ShoppingListItem, created[ShoppingListItem._meta.label],
+                     time.perf_counter() - started)
+
+        if connection.vendor == 'postgresql':
+            # id назначены явно, последовательности нужно сдвинуть
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                        no_style(), [User, Recipe, Ingredient]):
+                    cursor.execute(sql)
+        # строки вставлены без сигналов
+        bump_versions(
+            MeasurementUnit, Ingredient, Tag, User, Recipe,
+            FavoritedRecipeByUser, ShoppingCartByUser,
+            SubscribersByCurrentUser)
+    return created
+
+
+def fill_seeded_aggregates(first_user_id, first_recipe_id):
+    """Счетчики новых рецептов и сводные списки покупок новых
+    пользователей, одним запросом каждые. Возвращает количество
+    строк списков покупок."""
+    Recipe.objects.filter(id__gte=first_recipe_id).update(
+        **get_actual_counters())
+    rows = RecipeIngredient.objects.filter(
+        recipe__shoppingcartbyuser__current_user__gte=first_user_id
+    ).values_list(
+        'recipe__shoppingcartbyuser__current_user', 'recipe_ingredients'
+    ).annotate(total=Sum('amount')).order_by()
+    sql, params = rows.query.sql_with_params()
+    opts = ShoppingListItem._meta
+    quote = connection.ops.quote_name
+    columns = ', '.join(
+        quote(opts.get_field(name).column)
+        for name in ('current_user', 'ingredient', 'amount'))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(opts.db_table)} ({columns}) {sql}', params)
+        return cursor.rowcount
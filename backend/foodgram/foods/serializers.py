@@ -3,10 +3,12 @@ from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.serializers import ValidationError
 
+from foods.image_variants import get_variant_urls
 from foods.models import (
     FavoritedRecipeByUser, Ingredient, Recipe, RecipeIngredient, Tag
 )
 from users.models import ShoppingCartByUser
+from users.services import get_subscription_ids
 
 User = get_user_model()
 
@@ -15,6 +17,8 @@ class FilteredListSerializer(serializers.ListSerializer):
     """Обработка количества объектов внутри поля recipes."""
 
     def to_representation(self, data):
+        # all() отдает результат prefetch_related без запроса к БД
+        data = data.all()
         if 'recipes_limit' in self.context['request'].query_params.keys():
             recipes_limit = (
                 self.context['request'].query_params['recipes_limit'])
@@ -22,20 +26,37 @@ class FilteredListSerializer(serializers.ListSerializer):
                 raise ValidationError(
                     {'detail':
                         'recipes_limit должен содержать числовые значения'})
-            data = data.all()[:int(recipes_limit)]
-        data = data.all()
+            data = data[:int(recipes_limit)]
         return super(FilteredListSerializer, self).to_representation(data)
 
 
+class ImageVariantsField(serializers.Field):
+    """Ссылки на уменьшенные копии картинки рецепта"""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        request = self.context.get('request')
+        return {
+            name: request.build_absolute_uri(url) if request and url else url
+            for name, url in get_variant_urls(recipe).items()
+        }
+
+
 class AddedFavoriteSerializer(serializers.ModelSerializer):
     cooking_time = serializers.CharField(source='time', max_length=200)
     name = serializers.CharField(source='title', max_length=5000)
+    image_variants = ImageVariantsField()
 
     class Meta:
         fields = ('cooking_time',
                   'id',
                   'name',
-                  'image')
+                  'image',
+                  'image_variants')
         list_serializer_class = FilteredListSerializer
         model = Recipe
 
@@ -59,7 +80,7 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 
 class RecipeIngredientCreateSerializer(serializers.Serializer):
     """Сереализатор проверки приходящих данных для ингредиентов """
-    amount = serializers.CharField()
+    amount = serializers.IntegerField(min_value=1)
     id = serializers.IntegerField()
 
 
@@ -84,6 +105,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     text = serializers.CharField(source='description', max_length=5000)
     name = serializers.CharField(source='title', max_length=5000)
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -91,12 +113,15 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = ('author', 'id', 'cooking_time',
                   'ingredients', 'tags',
                   'ingredient_title', 'name',
-                  'text', 'image', 'is_favorited',
-                  'is_in_shopping_cart')
+                  'text', 'image', 'image_variants',
+                  'is_favorited', 'is_in_shopping_cart')
 
         model = Recipe
 
     def get_is_favorited(self, obj):
+        # Значение из аннотации Recipe.objects.with_user_flags
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         if user.is_anonymous:
             return False
@@ -104,6 +129,8 @@ class RecipeSerializer(serializers.ModelSerializer):
             recipe=obj, current_user=user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         if user.is_anonymous:
             return False
@@ -111,10 +138,127 @@ class RecipeSerializer(serializers.ModelSerializer):
             recipe=obj, current_user=user).exists()
 
 
+def get_tag_rows(recipe_ids):
+    """{id рецепта: [тег]} одним запросом, теги упорядочены по id,
+    как в Recipe.objects.with_related()"""
+    tags = {}
+    for recipe_id, tag_id, name, slug, color in Tag.objects.filter(
+            recipes__in=recipe_ids).values_list(
+            'recipes', 'id', 'name', 'slug', 'color').order_by('id'):
+        tags.setdefault(recipe_id, []).append(
+            {'id': tag_id, 'name': name, 'slug': slug, 'color': color})
+    return tags
+
+
+def get_ingredient_rows(recipe_ids):
+    """{id рецепта: [ингредиент]} одним запросом, строки упорядочены
+    по id, как в Recipe.objects.with_related()"""
+    ingredients = {}
+    for recipe_id, ingredient_id, name, unit, amount in (
+            RecipeIngredient.objects.filter(
+                recipe__in=recipe_ids).values_list(
+                'recipe', 'recipe_ingredients', 'recipe_ingredients__title',
+                'recipe_ingredients__measurement_unit__title', 'amount'
+            ).order_by('id')):
+        ingredients.setdefault(recipe_id, []).append({
+            'id': str(ingredient_id),
+            'name': name,
+            'measurement_unit': unit,
+            'amount': amount,
+        })
+    return ingredients
+
+
+def get_is_subscribed(author, request):
+    # Значение из аннотации queryset, если она есть
+    if hasattr(author, 'is_subscribed'):
+        return author.is_subscribed
+    if request is None:
+        return False
+    return author.id in get_subscription_ids(request)
+
+
+def get_user_flag(recipe, name, model, request):
+    # Значение из аннотации Recipe.objects.with_user_flags
+    if hasattr(recipe, name):
+        return getattr(recipe, name)
+    if request is None or request.user.is_anonymous:
+        return False
+    return model.objects.filter(
+        recipe=recipe, current_user=request.user).exists()
+
+
+class RecipeReadListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        return self.child.represent(list(data))
+
+
+class RecipeReadSerializer(serializers.BaseSerializer):
+    """Вывод рецептов в списке и при просмотре: тот же JSON, что
+    у RecipeSerializer, но словари строятся напрямую, без полей DRF.
+    Автор берется из select_related, признаки пользователя - из
+    аннотаций with_user_flags, теги и ингредиенты всех рецептов
+    страницы загружаются двумя запросами в виде строк, без моделей.
+    Совпадение с RecipeSerializer проверяет check_recipe_serializer."""
+
+    class Meta:
+        list_serializer_class = RecipeReadListSerializer
+
+    def to_representation(self, recipe):
+        return self.represent([recipe])[0]
+
+    def represent(self, recipes):
+        if not recipes:
+            return []
+        request = self.context.get('request')
+        recipe_ids = [recipe.id for recipe in recipes]
+        tags = get_tag_rows(recipe_ids)
+        ingredients = get_ingredient_rows(recipe_ids)
+
+        def absolute(url):
+            if request is not None and url:
+                return request.build_absolute_uri(url)
+            return url
+
+        data = []
+        for recipe in recipes:
+            author = recipe.author
+            data.append({
+                'author': {
+                    'id': author.id,
+                    'username': author.username,
+                    'email': author.email,
+                    'first_name': author.first_name,
+                    'last_name': author.last_name,
+                    'is_subscribed': get_is_subscribed(author, request),
+                },
+                'id': recipe.id,
+                'cooking_time': str(recipe.time),
+                'ingredients': ingredients.get(recipe.id, []),
+                'tags': tags.get(recipe.id, []),
+                'name': recipe.title,
+                'text': recipe.description,
+                'image': absolute(recipe.image.url) if recipe.image else None,
+                'image_variants': {
+                    name: absolute(url)
+                    for name, url in get_variant_urls(recipe).items()
+                },
+                'is_favorited': get_user_flag(
+                    recipe, 'is_favorited', FavoritedRecipeByUser, request),
+                'is_in_shopping_cart': get_user_flag(
+                    recipe, 'is_in_shopping_cart', ShoppingCartByUser,
+                    request),
+            })
+        return data
+
+
 class RecipeCreateSerializer(serializers.ModelSerializer):
     ingredients = RecipeIngredientCreateSerializer(
         many=True,)
-    cooking_time = serializers.CharField(source='time', max_length=200)
+    tags = serializers.ListField(child=serializers.IntegerField())
+    # Recipe.time - PositiveSmallIntegerField
+    cooking_time = serializers.IntegerField(
+        source='time', min_value=1, max_value=32767)
     text = serializers.CharField(source='description', max_length=5000)
     name = serializers.CharField(source='title', max_length=5000)
     image = Base64ImageField()
@@ -126,6 +270,19 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                   'text', 'image')
         model = Recipe
 
+    def validate_ingredients(self, value):
+        ingredient_ids = [ingredient['id'] for ingredient in value]
+        if len(ingredient_ids) != len(set(ingredient_ids)):
+            raise ValidationError('Ингредиенты не должны повторяться')
+        return value
+
+    def validate_tags(self, value):
+        """Все теги проверяются одним запросом"""
+        tags = list(Tag.objects.filter(id__in=value))
+        if len(tags) != len(set(value)):
+            raise ValidationError('Тег не найден')
+        return tags
+
 
 class AddedShoppingCartSerializer(serializers.ModelSerializer):
     cooking_time = serializers.CharField(source='time', max_length=200)
@@ -1,26 +1,375 @@
-from django.db.models import Sum
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.http import Http404
+
+from .cache import bump_versions
+from .models import (
+    FavoritedRecipeByUser, Ingredient, MeasurementUnit, Recipe,
+    RecipeIngredient
+)
+from users.models import ShoppingCartByUser, ShoppingListItem
+
+User = get_user_model()
 
 
 def download_shopping_cart(user):
-    all_recipe_in_shopping_cart = (
-        user.user_to_shopping_cart.values(
-            'recipe__ingredient__title',
-            'recipe__ingredient__measurement_unit__title',
-            'recipe__recipeingredient__amount'))
-
-    all_recipe_in_shopping_cart = all_recipe_in_shopping_cart.values(
-        'recipe__ingredient__title',
-        'recipe__ingredient__measurement_unit__title').annotate(
-        recipe__recipeingredient__amount=(
-            Sum('recipe__recipeingredient__amount')))
-
-    result_string = ''
-    for item in all_recipe_in_shopping_cart:
-        name = item['recipe__ingredient__title']
-        measurement_title = (
-            item['recipe__ingredient__measurement_unit__title'])
-        amount = item['recipe__recipeingredient__amount']
-        result_string += (
-            f'{name} ({measurement_title}) — {amount} \n')
-
-    return result_string
+    """Строки списка покупок из сводной таблицы ShoppingListItem,
+    отдаются по одной без накопления в памяти."""
+
+    items = user.shopping_list.values(
+        'ingredient__title',
+        'ingredient__measurement_unit__title',
+        'amount'
+    ).order_by('ingredient__title')
+    for item in items.iterator():
+        name = item['ingredient__title']
+        measurement_title = item['ingredient__measurement_unit__title']
+        amount = item['amount']
+        yield f'{name} ({measurement_title}) — {amount} \n'
+
+
+def get_recipe_amounts(recipe):
+    """Количество каждого ингредиента в рецепте."""
+
+    amounts = Counter()
+    for ingredient_id, amount in recipe.recipeingredient_set.values_list(
+            'recipe_ingredients_id', 'amount'):
+        amounts[ingredient_id] += amount
+    return amounts
+
+
+def get_ingredient_amounts(ingredients):
+    """{id ингредиента: количество} из проверенных данных запроса.
+    Существование всех ингредиентов проверяется одним запросом."""
+
+    amounts = {
+        ingredient['id']: ingredient['amount']
+        for ingredient in ingredients
+    }
+    found = Ingredient.objects.filter(id__in=amounts).count()
+    if found != len(amounts):
+        raise Http404('Ингредиент не найден')
+    return amounts
+
+
+def update_recipe_fields(recipe, validated_data):
+    """Записывает только изменившиеся поля рецепта.
+    Картинка считается измененной, если отличается ее содержимое."""
+
+    changed = []
+    for name in ('title', 'description', 'time'):
+        if name not in validated_data:
+            continue
+        value = validated_data[name]
+        if getattr(recipe, name) != value:
+            setattr(recipe, name, value)
+            changed.append(name)
+    image = validated_data.get('image')
+    if image is not None and not is_same_file(recipe.image, image):
+        recipe.image = image
+        changed.append('image')
+    if changed:
+        recipe.save(update_fields=changed)
+    return changed
+
+
+def is_same_file(field_file, new_file):
+    if not field_file:
+        return False
+    try:
+        if field_file.size != new_file.size:
+            return False
+        with field_file.open('rb') as stored_file:
+            stored = stored_file.read()
+    except OSError:
+        return False
+    new_file.seek(0)
+    return stored == new_file.read()
+
+
+def update_recipe_tags(recipe, tags):
+    """Добавляет и удаляет только отличающиеся теги."""
+
+    stored_ids = {tag.id for tag in recipe.tags.all()}
+    new_ids = {tag.id for tag in tags}
+    if new_ids - stored_ids:
+        recipe.tags.add(*(new_ids - stored_ids))
+    if stored_ids - new_ids:
+        recipe.tags.remove(*(stored_ids - new_ids))
+
+
+def update_recipe_ingredients(recipe, amounts):
+    """Приводит ингредиенты рецепта к amounts {id ингредиента: количество}
+    пакетными вставкой, обновлением и удалением только отличающихся строк.
+    Возвращает изменение количеств для сводных списков покупок."""
+
+    stored = {}
+    old_amounts = Counter()
+    to_delete = []
+    for row in recipe.recipeingredient_set.all():
+        old_amounts[row.recipe_ingredients_id] += row.amount
+        if row.recipe_ingredients_id in stored:
+            # повторная строка того же ингредиента
+            to_delete.append(row.id)
+        else:
+            stored[row.recipe_ingredients_id] = row
+    to_update = []
+    for ingredient_id, row in stored.items():
+        if ingredient_id not in amounts:
+            to_delete.append(row.id)
+        elif row.amount != amounts[ingredient_id]:
+            row.amount = amounts[ingredient_id]
+            to_update.append(row)
+    to_create = [
+        RecipeIngredient(recipe=recipe, recipe_ingredients_id=ingredient_id,
+                         amount=amount)
+        for ingredient_id, amount in amounts.items()
+        if ingredient_id not in stored
+    ]
+
+    if to_delete:
+        RecipeIngredient.objects.filter(id__in=to_delete).delete()
+    if to_update:
+        RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+    if to_create:
+        RecipeIngredient.objects.bulk_create(to_create)
+    if to_update or to_create:
+        # пакетные операции не отправляют сигналы
+        bump_versions(Recipe)
+    return get_amounts_delta(old_amounts, amounts)
+
+
+def get_amounts_delta(old_amounts, new_amounts):
+    """Разница количеств ингредиентов рецепта до и после изменения."""
+
+    return {
+        ingredient_id: (
+            new_amounts.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0))
+        for ingredient_id in {*old_amounts, *new_amounts}
+    }
+
+
+def apply_shopping_list_delta(user_ids, delta):
+    """Прибавляет delta {id ингредиента: количество} к сводным спискам
+    покупок пользователей. Число запросов зависит только от количества
+    изменившихся ингредиентов."""
+
+    delta = {
+        ingredient_id: amount
+        for ingredient_id, amount in delta.items() if amount}
+    if not delta:
+        return
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    items = ShoppingListItem.objects.filter(current_user_id__in=user_ids)
+    with transaction.atomic():
+        lock_shopping_lists(user_ids)
+        existing = set(items.filter(ingredient_id__in=delta).values_list(
+            'current_user_id', 'ingredient_id'))
+        for ingredient_id, amount in delta.items():
+            items.filter(ingredient_id=ingredient_id).update(
+                amount=F('amount') + amount)
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(current_user_id=user_id,
+                             ingredient_id=ingredient_id,
+                             amount=amount)
+            for user_id in user_ids
+            for ingredient_id, amount in delta.items()
+            if amount > 0 and (user_id, ingredient_id) not in existing)
+        items.filter(amount__lte=0).delete()
+
+
+def lock_shopping_lists(user_ids):
+    """Блокирует строки пользователей до конца транзакции: изменения
+    сводного списка покупок одного пользователя выполняются по очереди,
+    и найденные строки не расходятся с последующей вставкой."""
+
+    list(User.objects.select_for_update().filter(
+        id__in=user_ids).order_by('id').values_list('id', flat=True))
+
+
+def get_cart_user_ids(recipe):
+    """Пользователи, у которых рецепт находится в списке покупок."""
+
+    return ShoppingCartByUser.objects.filter(
+        recipe=recipe).values_list('current_user_id', flat=True)
+
+
+def calculate_shopping_lists(user_ids=None):
+    """Сводные списки покупок, посчитанные заново по спискам покупок:
+    {id пользователя: {id ингредиента: количество}}."""
+
+    # условия на список покупок в одном filter(), чтобы не получить
+    # второй JOIN по той же связи
+    cart_filter = {'recipe__shoppingcartbyuser__isnull': False}
+    if user_ids is not None:
+        cart_filter = {
+            'recipe__shoppingcartbyuser__current_user__in': user_ids}
+    rows = RecipeIngredient.objects.filter(**cart_filter).values_list(
+        'recipe__shoppingcartbyuser__current_user', 'recipe_ingredients'
+    ).annotate(total=Sum('amount')).order_by()
+    shopping_lists = defaultdict(dict)
+    for user_id, ingredient_id, total in rows.iterator():
+        shopping_lists[user_id][ingredient_id] = total
+    return shopping_lists
+
+
+def rebuild_shopping_lists(user_ids):
+    """Пересобирает сводные списки покупок пользователей с нуля."""
+
+    with transaction.atomic():
+        lock_shopping_lists(user_ids)
+        shopping_lists = calculate_shopping_lists(user_ids)
+        ShoppingListItem.objects.filter(
+            current_user_id__in=user_ids).delete()
+        ShoppingListItem.objects.bulk_create(
+            (ShoppingListItem(current_user_id=user_id,
+                              ingredient_id=ingredient_id,
+                              amount=amount)
+             for user_id, amounts in shopping_lists.items()
+             for ingredient_id, amount in amounts.items()),
+            batch_size=1000)
+
+
+def rebuild_recipe_shopping_lists(recipe_ids):
+    """Пересобирает сводные списки покупок пользователей, у которых
+    рецепты находятся в списке покупок."""
+
+    user_ids = set(ShoppingCartByUser.objects.filter(
+        recipe__in=recipe_ids).values_list('current_user_id', flat=True))
+    if user_ids:
+        rebuild_shopping_lists(user_ids)
+
+
+def get_measurement_units(titles):
+    """{название: id} единиц измерения, недостающие создаются
+    одной пакетной вставкой."""
+
+    titles = set(titles)
+    units = dict(MeasurementUnit.objects.filter(
+        title__in=titles).values_list('title', 'id'))
+    missing = titles - units.keys()
+    if missing:
+        MeasurementUnit.objects.bulk_create(
+            (MeasurementUnit(title=title) for title in missing),
+            ignore_conflicts=True)
+        units.update(MeasurementUnit.objects.filter(
+            title__in=missing).values_list('title', 'id'))
+    return units
+
+
+def insert_ingredients(rows, units=None):
+    """Пакетная вставка ингредиентов из пар (название, единица измерения),
+    уже существующие пропускаются. Возвращает (создано, пропущено)."""
+
+    total = len(rows)
+    rows = list(dict.fromkeys(rows))
+    if units is None:
+        units = {}
+    missing_units = {unit for _, unit in rows} - units.keys()
+    if missing_units:
+        units.update(get_measurement_units(missing_units))
+    pairs = [(title, units[unit]) for title, unit in rows]
+    existing = set(Ingredient.objects.filter(
+        title__in={title for title, _ in pairs}
+    ).values_list('title', 'measurement_unit_id'))
+    new_pairs = [pair for pair in pairs if pair not in existing]
+    Ingredient.objects.bulk_create(
+        (Ingredient(title=title, measurement_unit_id=unit_id)
+         for title, unit_id in new_pairs),
+        ignore_conflicts=True)
+    if new_pairs:
+        # bulk_create не отправляет сигналы
+        bump_versions(Ingredient, MeasurementUnit)
+    return len(new_pairs), total - len(new_pairs)
+
+
+# счетчики рецепта и модели, записи которых они считают
+RECIPE_COUNTERS = {
+    'favorites_count': FavoritedRecipeByUser,
+    'in_carts_count': ShoppingCartByUser,
+}
+
+
+def change_recipe_counter(model, recipe_id, delta):
+    """Атомарно меняет счетчик рецепта для записи model на delta."""
+
+    field = next(
+        name for name, counted in RECIPE_COUNTERS.items()
+        if counted is model)
+    Recipe.objects.filter(id=recipe_id).update(
+        **{field: Greatest(F(field) + delta, 0)})
+
+
+def add_recipe_mark(model, user, recipe):
+    """Добавляет рецепт в избранное или список покупок (model) и
+    увеличивает его счетчик. У этих моделей нет сигналов, чтобы
+    каскадное удаление рецепта или пользователя стирало их записи
+    одним запросом."""
+
+    model.objects.create(current_user=user, recipe=recipe)
+    change_recipe_counter(model, recipe.id, 1)
+    bump_versions(model)
+
+
+def remove_recipe_mark(model, user, recipe):
+    """Удаляет рецепт из избранного или списка покупок (model) и
+    уменьшает его счетчик."""
+
+    deleted, _ = model.objects.filter(
+        current_user=user, recipe=recipe).delete()
+    if deleted:
+        change_recipe_counter(model, recipe.id, -deleted)
+        bump_versions(model)
+
+
+def get_marked_recipe_ids(user_ids):
+    """id рецептов в избранном и списках покупок пользователей,
+    одним запросом."""
+
+    querysets = [
+        model.objects.filter(current_user__in=user_ids).order_by()
+        .values_list('recipe_id', flat=True)
+        for model in RECIPE_COUNTERS.values()
+    ]
+    return set(querysets[0].union(*querysets[1:]))
+
+
+def get_actual_counters():
+    """Счетчики рецепта, посчитанные заново по таблицам, в виде
+    подзапросов для annotate() и update()."""
+
+    return {
+        field: Coalesce(Subquery(
+            model.objects.filter(recipe=OuterRef('pk')).order_by().values(
+                'recipe').annotate(total=Count('pk')).values('total')), 0)
+        for field, model in RECIPE_COUNTERS.items()
+    }
+
+
+def get_drifted_recipes():
+    """Рецепты, счетчики которых расходятся с таблицами."""
+
+    actual = {
+        f'actual_{field}': expression
+        for field, expression in get_actual_counters().items()
+    }
+    drifted = Q()
+    for field in RECIPE_COUNTERS:
+        drifted |= ~Q(**{field: F(f'actual_{field}')})
+    return Recipe.objects.annotate(**actual).filter(drifted).order_by('id')
+
+
+def recount_recipe_counters(recipe_ids=None):
+    """Пересчитывает счетчики рецептов одним UPDATE."""
+
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(id__in=recipe_ids)
+    return recipes.update(**get_actual_counters())
@@ -0,0 +1,121 @@
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from .cache import bump_versions
+from .image_variants import schedule_variants
+from .ingredient_index import schedule_rebuild
+from .models import Ingredient, MeasurementUnit, Recipe, RecipeIngredient, Tag
+from .services import (
+    RECIPE_COUNTERS, apply_shopping_list_delta, get_amounts_delta,
+    get_cart_user_ids, get_marked_recipe_ids, get_recipe_amounts,
+    recount_recipe_counters
+)
+from jobs.queue import enqueue
+from users.models import SubscribersByCurrentUser
+
+User = get_user_model()
+
+# поля пользователя, которые попадают в ответы API
+USER_FIELDS = {'username', 'email', 'first_name', 'last_name'}
+
+
+@receiver(connection_created)
+def register_sqlite_functions(connection, **kwargs):
+    """UNICODE_LOWER для models.UnicodeLower"""
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function(
+            'UNICODE_LOWER', 1,
+            lambda value: value if value is None else value.lower(),
+            deterministic=True)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=MeasurementUnit)
+@receiver(post_delete, sender=MeasurementUnit)
+def rebuild_ingredient_index(**kwargs):
+    """Индекс поиска ингредиентов пересобирается при их изменении"""
+    schedule_rebuild()
+
+
+# у избранного, списков покупок и подписок нет сигналов: иначе
+# каскадное удаление рецепта или пользователя загружало бы их записи
+# и обрабатывало по одной. Версии и счетчики для них меняют
+# foods.services и обработчики удаления рецепта и пользователя ниже.
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=MeasurementUnit)
+@receiver(post_delete, sender=MeasurementUnit)
+def bump_model_version(sender, **kwargs):
+    """Новая версия для ETag/Last-Modified и кэша количества"""
+    bump_versions(sender)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_version(**kwargs):
+    """Новая версия рецептов для кэша страниц списка"""
+    bump_versions(Recipe)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_user_version(update_fields=None, **kwargs):
+    """Новая версия пользователей, кроме записи last_login при входе"""
+    if update_fields is None or USER_FIELDS & set(update_fields):
+        bump_versions(User)
+
+
+@receiver(post_save, sender=Recipe)
+def create_image_variants(instance, update_fields=None, **kwargs):
+    """Копии картинки создаются после ее загрузки или замены"""
+    if update_fields is None or 'image' in update_fields:
+        schedule_variants(instance.id)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_image(instance, **kwargs):
+    """Файлы картинки удаленного рецепта удаляются фоновой задачей"""
+    if instance.image:
+        enqueue('foods.delete_recipe_image', name=instance.image.name)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_from_shopping_lists(instance, **kwargs):
+    """Ингредиенты рецепта вычитаются из сводных списков покупок при
+    любом удалении рецепта, в том числе каскадном вместе с автором,
+    до удаления его ингредиентов и записей списков покупок"""
+    apply_shopping_list_delta(
+        get_cart_user_ids(instance),
+        get_amounts_delta(get_recipe_amounts(instance), {}))
+
+
+@receiver(post_delete, sender=Recipe)
+def bump_recipe_mark_versions(**kwargs):
+    """Записи избранного и списков покупок рецепта удалены каскадом"""
+    bump_versions(*RECIPE_COUNTERS.values())
+
+
+@receiver(pre_delete, sender=User)
+def collect_marked_recipes(instance, **kwargs):
+    """Рецепты, счетчики которых изменит удаление пользователя"""
+    instance._marked_recipe_ids = get_marked_recipe_ids([instance.id])
+
+
+@receiver(post_delete, sender=User)
+def recount_marked_recipes(instance, **kwargs):
+    """Счетчики рецептов пересчитываются одним запросом после
+    каскадного удаления записей пользователя"""
+    recipe_ids = getattr(instance, '_marked_recipe_ids', None)
+    if recipe_ids:
+        recount_recipe_counters(recipe_ids)
+    bump_versions(*RECIPE_COUNTERS.values(), SubscribersByCurrentUser)
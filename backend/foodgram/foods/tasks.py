@@ -0,0 +1,23 @@
+from sorl.thumbnail import delete as delete_thumbnails
+
+from .image_variants import generate_variants
+from .ingredient_index import build_index
+from .models import Recipe
+from jobs.queue import task
+
+
+@task('foods.generate_image_variants')
+def generate_image_variants(recipe_id):
+    generate_variants(recipe_id)
+
+
+@task('foods.rebuild_ingredient_index')
+def rebuild_ingredient_index():
+    build_index()
+
+
+@task('foods.delete_recipe_image')
+def delete_recipe_image(name):
+    """Удаляет картинку удаленного рецепта вместе с ее копиями"""
+    if not Recipe.objects.filter(image=name).exists():
+        delete_thumbnails(Recipe(image=name).image)
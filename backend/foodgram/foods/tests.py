@@ -0,0 +1,480 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .admin import RecipeIngredientAdmin
+from .diagnostics import (
+    explain, get_query_shapes, render_pair, seed_edge_cases
+)
+from .ingredient_index import build_index
+from .models import (
+    FavoritedRecipeByUser, Ingredient, MeasurementUnit, Recipe,
+    RecipeIngredient, Tag
+)
+from .services import (
+    calculate_shopping_lists, download_shopping_cart, get_drifted_recipes,
+    rebuild_shopping_lists, recount_recipe_counters
+)
+from users.admin import ShoppingCartByUserAdmin
+from users.models import (
+    ShoppingCartByUser, ShoppingListItem, SubscribersByCurrentUser
+)
+
+User = get_user_model()
+
+LOCAL_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': f'test-{alias}'}
+    for alias in settings.CACHES}
+
+
+def clear_caches():
+    for alias in LOCAL_CACHES:
+        caches[alias].clear()
+
+
+def create_dataset(recipes=60):
+    """Авторы, теги, ингредиенты и рецепты; у пользователя viewer есть
+    избранное, список покупок и подписка"""
+    unit = MeasurementUnit.objects.create(title='г')
+    ingredients = Ingredient.objects.bulk_create(
+        Ingredient(title=f'ингредиент {number}',
+                   measurement_unit=unit if number else None)
+        for number in range(10))
+    tags = Tag.objects.bulk_create(
+        Tag(name=name, slug=slug, color=color) for name, slug, color in (
+            ('Завтрак', 'breakfast', '#E26C2D'),
+            ('Обед', 'lunch', '#49B64E'),
+            ('Ужин', 'dinner', '#8775D2')))
+    authors = [User.objects.create(
+        username=f'author{number}', email=f'author{number}@example.com')
+        for number in range(3)]
+    viewer = User.objects.create(
+        username='viewer', email='viewer@example.com')
+    created = [Recipe.objects.create(
+        author=authors[number % len(authors)], title=f'рецепт {number}',
+        description='описание', image='foods_images/test.png',
+        time=number + 1) for number in range(recipes)]
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe=recipe, tag=tag)
+        for number, recipe in enumerate(created)
+        for tag in tags[:number % len(tags) + 1])
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe,
+                         recipe_ingredients=ingredients[
+                             (number + offset) % len(ingredients)],
+                         amount=offset + 1)
+        for number, recipe in enumerate(created) for offset in range(3))
+    FavoritedRecipeByUser.objects.create(
+        current_user=viewer, recipe=created[0])
+    ShoppingCartByUser.objects.create(current_user=viewer, recipe=created[1])
+    SubscribersByCurrentUser.objects.create(
+        current_user=viewer, subscription=authors[0])
+    return viewer
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class RecipeListQueriesTest(TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_dataset()
+
+    def setUp(self):
+        # страница и количество из кэша сократили бы число запросов
+        clear_caches()
+
+    def assert_queries(self, client, expected):
+        for limit in (6, 50):
+            clear_caches()
+            with self.subTest(limit=limit), self.assertNumQueries(expected):
+                response = client.get('/api/recipes/', {'limit': limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous(self):
+        # количество, рецепты, теги, ингредиенты
+        self.assert_queries(APIClient(), 4)
+
+    def test_authenticated(self):
+        client = APIClient()
+        client.force_authenticate(self.viewer)
+        # и подписки пользователя
+        self.assert_queries(client, 5)
+
+
+@override_settings(CACHES=LOCAL_CACHES, INGREDIENT_SEARCH_LIMIT=3)
+class IngredientSearchTest(TestCase):
+    """Поиск по индексу и запросом к БД дает одинаковый результат"""
+
+    @classmethod
+    def setUpTestData(cls):
+        unit = MeasurementUnit.objects.create(title='г')
+        Ingredient.objects.bulk_create(
+            Ingredient(title=title, measurement_unit=unit)
+            for title in ('Sugar', 'brown sugar', 'SUGAR syrup', 'sugar',
+                          'salt', 'Vanilla Sugar', 'ингредиент соль',
+                          'Сахар ИНГРЕДИЕНТ', 'Ингредиент', 'Соль'))
+
+    def search(self, name):
+        clear_caches()
+        response = self.client.get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_index_and_database_match(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'index.bin')
+            for name, expected in (
+                    ('SUG', ['Sugar', 'sugar', 'SUGAR syrup']),
+                    ('sugar ', ['SUGAR syrup']),
+                    ('nilla', ['Vanilla Sugar']),
+                    # регистр кириллицы, порядок по байтам названия
+                    ('ИНГР', ['Ингредиент', 'ингредиент соль',
+                              'Сахар ИНГРЕДИЕНТ']),
+                    ('соль', ['Соль', 'ингредиент соль'])):
+                with override_settings(INGREDIENT_INDEX_PATH=path):
+                    database = self.search(name)
+                    build_index()
+                    indexed = self.search(name)
+                    os.unlink(path)
+                with self.subTest(name=name):
+                    self.assertEqual(database, expected)
+                    self.assertEqual(indexed, expected)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class RecipeDestroyTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_dataset(recipes=3)
+        cls.recipe = Recipe.objects.order_by('id').first()
+
+    def delete(self, user, recipe_id):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.delete(f'/api/recipes/{recipe_id}/')
+
+    def test_author_deletes(self):
+        response = self.delete(self.recipe.author, self.recipe.id)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Recipe.objects.filter(id=self.recipe.id).exists())
+
+    def test_other_user_forbidden(self):
+        viewer = User.objects.get(username='viewer')
+        self.assertEqual(self.delete(viewer, self.recipe.id).status_code, 403)
+        self.assertTrue(Recipe.objects.filter(id=self.recipe.id).exists())
+
+    def test_missing_recipe(self):
+        self.assertEqual(
+            self.delete(self.recipe.author, 0).status_code, 404)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class RecipePageCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_dataset(recipes=8)
+
+    def setUp(self):
+        clear_caches()
+
+    def get_outcome(self, params):
+        response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200)
+        return response['X-Cache']
+
+    def test_outcomes(self):
+        self.assertEqual(self.get_outcome({'page': 2}), 'MISS')
+        self.assertEqual(self.get_outcome({'page': 2}), 'HIT')
+        # ложный признак пользователя не меняет страницу
+        self.assertEqual(
+            self.get_outcome({'page': 2, 'is_favorited': '0'}), 'HIT')
+        self.assertEqual(self.get_outcome({'is_favorited': '1'}), 'BYPASS')
+        self.assertEqual(self.get_outcome({'unknown': '1'}), 'BYPASS')
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class QueryPlanTest(TestCase):
+    """Частые запросы используют индексы, а не полный просмотр таблиц"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_dataset()
+
+    # индексы, которые SQLite выбирает для страниц в порядке ленты
+    SQLITE_INDEXES = {
+        'рецепты: страница': 'recipe_pub_date_id_idx',
+        'рецепты: страница по курсору': 'recipe_pub_date_id_idx',
+        'рецепты: ?author=': 'recipe_author_pub_date_idx',
+        'рецепты: ?ordering=popular': 'recipe_popular_idx',
+        'подписки: рецепты авторов': 'recipe_author_pub_date_idx',
+    }
+
+    def test_no_sequential_scans(self):
+        author = User.objects.get(username='author0')
+        shapes = get_query_shapes(self.viewer, author, ['breakfast', 'lunch'])
+        for name, queryset in shapes.items():
+            lines, scans = explain(queryset)
+            with self.subTest(name):
+                self.assertEqual(scans, [], '\n'.join(lines))
+                if connection.vendor == 'sqlite' and (
+                        name in self.SQLITE_INDEXES):
+                    self.assertRegex(
+                        '\n'.join(lines),
+                        rf'INDEX {self.SQLITE_INDEXES[name]}\b')
+
+    def test_sequential_scan_is_reported(self):
+        lines, scans = explain(
+            Recipe.objects.filter(description='текст').order_by())
+        self.assertEqual(scans, ['foods_recipe'], '\n'.join(lines))
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class RecipeTagFilterTest(TestCase):
+    """?tags= отбирает рецепты хотя бы с одним из тегов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_dataset(recipes=9)
+        # теги рецепта зависят от его номера: 0 - breakfast,
+        # 1 - breakfast и lunch, 2 - все три
+        cls.numbers = {
+            recipe.id: int(recipe.title.split()[-1])
+            for recipe in Recipe.objects.all()}
+
+    def setUp(self):
+        clear_caches()
+
+    def get_numbers(self, tags):
+        response = self.client.get(
+            '/api/recipes/', {'tags': tags, 'limit': 100})
+        self.assertEqual(response.status_code, 200)
+        ids = [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(response.data['count'], len(ids))
+        return sorted(self.numbers[recipe_id] for recipe_id in ids)
+
+    def test_one_tag(self):
+        self.assertEqual(self.get_numbers(['dinner']), [2, 5, 8])
+
+    def test_any_of_several_tags(self):
+        self.assertEqual(
+            self.get_numbers(['lunch', 'dinner']), [1, 2, 4, 5, 7, 8])
+        self.assertEqual(
+            self.get_numbers(['breakfast', 'dinner']), list(range(9)))
+
+    def test_no_duplicates_for_recipes_with_several_matching_tags(self):
+        self.assertEqual(
+            self.get_numbers(['breakfast', 'lunch', 'dinner']),
+            list(range(9)))
+
+    def test_unknown_slug(self):
+        response = self.client.get('/api/recipes/', {'tags': 'unknown'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_new_tag_is_accepted(self):
+        Tag.objects.create(name='Десерт', slug='dessert', color='#F2C94C')
+        # версия тегов меняется после фиксации транзакции
+        clear_caches()
+        self.assertEqual(self.get_numbers(['dessert']), [])
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class RecipeCounterTest(TestCase):
+    """Счетчики избранного и списков покупок после добавления, удаления
+    и каскадного удаления рецепта или пользователя"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_dataset(recipes=20)
+        cls.recipes = list(Recipe.objects.order_by('id'))
+        cls.users = [User.objects.create(
+            username=f'fan{number}', email=f'fan{number}@example.com')
+            for number in range(20)]
+        recount_recipe_counters()
+
+    def mark(self, users, recipes):
+        for model in (FavoritedRecipeByUser, ShoppingCartByUser):
+            model.objects.bulk_create(
+                model(current_user=user, recipe=recipe)
+                for user in users for recipe in recipes)
+        recount_recipe_counters()
+
+    def count_delete_queries(self, instance):
+        with CaptureQueriesContext(connection) as queries:
+            instance.delete()
+        return len(queries.captured_queries)
+
+    def test_add_and_remove(self):
+        recipe = self.recipes[5]
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        for path in ('favorite', 'shopping_cart'):
+            url = f'/api/recipes/{recipe.id}/{path}/'
+            self.assertEqual(client.post(url).status_code, 200)
+            recipe.refresh_from_db()
+            self.assertEqual(
+                (recipe.favorites_count, recipe.in_carts_count),
+                (1, 1) if path == 'shopping_cart' else (1, 0))
+        for path in ('favorite', 'shopping_cart'):
+            url = f'/api/recipes/{recipe.id}/{path}/'
+            self.assertEqual(client.delete(url).status_code, 204)
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (recipe.favorites_count, recipe.in_carts_count), (0, 0))
+
+    def test_user_delete(self):
+        few, many = self.users[:2]
+        self.mark([few], self.recipes[:2])
+        self.mark([many], self.recipes)
+        # записи пользователя удаляются и пересчитываются пакетно
+        self.assertEqual(
+            self.count_delete_queries(few), self.count_delete_queries(many))
+        self.assertFalse(get_drifted_recipes().exists())
+        self.assertEqual(
+            Recipe.objects.get(id=self.recipes[0].id).favorites_count, 1)
+
+    def test_recipe_delete(self):
+        few, many = self.recipes[:2]
+        self.mark(self.users[:1], [few])
+        self.mark(self.users, [many])
+        self.assertEqual(
+            self.count_delete_queries(few), self.count_delete_queries(many))
+        self.assertFalse(FavoritedRecipeByUser.objects.filter(
+            recipe__in=[few, many]).exists())
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class RecipeSerializerParityTest(TestCase):
+    """RecipeReadSerializer отдает тот же JSON, что и RecipeSerializer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_dataset(recipes=20)
+        cls.user = seed_edge_cases()
+        # теги и ингредиенты добавлены не в порядке id
+        recipe = Recipe.objects.create(
+            author=cls.user, title='обратный порядок', description='',
+            image='foods_images/test.png', time=1)
+        for tag in Tag.objects.order_by('-id')[:3]:
+            recipe.tags.add(tag)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, recipe_ingredients=ingredient,
+                             amount=1)
+            for ingredient in Ingredient.objects.order_by('-id')[:3])
+
+    def test_same_json(self):
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        for viewer in (AnonymousUser(), self.user):
+            pairs = render_pair(recipe_ids, viewer)
+            self.assertEqual(len(pairs), len(recipe_ids))
+            for recipe_id, expected, actual in pairs:
+                with self.subTest(recipe=recipe_id, user=str(viewer)):
+                    self.assertEqual(actual.decode(), expected.decode())
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class ShoppingListTest(TestCase):
+    """Сводный список покупок совпадает с пересчетом по спискам покупок
+    при любом способе удаления рецептов и записей"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_dataset(recipes=6)
+        # рецепт 1 автора author1 уже в списке покупок, у рецепта 3
+        # автора author0 с ним общий ингредиент
+        cls.recipes = list(Recipe.objects.order_by('id'))
+        ShoppingCartByUser.objects.create(
+            current_user=cls.viewer, recipe=cls.recipes[3])
+        rebuild_shopping_lists([cls.viewer.id])
+
+    def assert_consistent(self):
+        actual = {}
+        for user_id, ingredient_id, amount in (
+                ShoppingListItem.objects.values_list(
+                    'current_user_id', 'ingredient_id', 'amount')):
+            actual.setdefault(user_id, {})[ingredient_id] = amount
+        self.assertEqual(actual, dict(calculate_shopping_lists()))
+
+    def get_lines(self):
+        return list(download_shopping_cart(self.viewer))
+
+    def test_author_deleted(self):
+        self.assertEqual(len(self.get_lines()), 5)
+        User.objects.get(username='author1').delete()
+        self.assert_consistent()
+        self.assertEqual(len(self.get_lines()), 3)
+
+    def test_queryset_delete(self):
+        Recipe.objects.filter(
+            id__in=[self.recipes[1].id, self.recipes[3].id]).delete()
+        self.assert_consistent()
+        self.assertEqual(self.get_lines(), [])
+
+    def test_admin_cart_delete(self):
+        cart_admin = ShoppingCartByUserAdmin(ShoppingCartByUser, admin.site)
+        cart_admin.delete_queryset(None, ShoppingCartByUser.objects.filter(
+            recipe=self.recipes[1]))
+        self.assert_consistent()
+        self.assertEqual(len(self.get_lines()), 3)
+
+    def test_admin_recipe_ingredient_delete(self):
+        ingredient_admin = RecipeIngredientAdmin(
+            RecipeIngredient, admin.site)
+        ingredient_admin.delete_queryset(
+            None, RecipeIngredient.objects.filter(recipe=self.recipes[1]))
+        self.assert_consistent()
+        self.assertEqual(len(self.get_lines()), 3)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class RecipeValidationTest(TestCase):
+    """Неверные данные рецепта - ответ 400, а не ошибка сервера"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_dataset(recipes=3)
+        cls.recipe = Recipe.objects.order_by('id').first()
+        cls.ingredient = Ingredient.objects.first()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.recipe.author)
+
+    def test_ingredient_amount(self):
+        for amount in ('abc', -1, 0):
+            with self.subTest(amount=amount):
+                response = self.client.patch(
+                    f'/api/recipes/{self.recipe.id}/',
+                    {'ingredients': [
+                        {'id': self.ingredient.id, 'amount': amount}]},
+                    format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('amount', response.data['ingredients'][0])
+
+    def test_cooking_time(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        for cooking_time in ('abc', 0, 40000):
+            with self.subTest(cooking_time=cooking_time):
+                response = self.client.patch(
+                    url, {'cooking_time': cooking_time}, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('cooking_time', response.data)
+        response = self.client.patch(
+            url, {'cooking_time': '15'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.time, 15)
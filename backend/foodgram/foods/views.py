@@ -1,30 +1,41 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.functions import Collate
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters import rest_framework as filters
 from rest_framework import status, viewsets
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import AllowAny, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from .cache import ConditionalGetMixin
 from .filters import RecipeFilter
+from .ingredient_index import get_index, schedule_rebuild, search_ingredients
 from .models import (
     FavoritedRecipeByUser, Ingredient, MeasurementUnit, Recipe,
-    RecipeIngredient, Tag
+    RecipeIngredient, Tag, UnicodeLower
 )
-from .paginations import CustomPageNumberPagination
+from .page_cache import RecipePageCacheMixin
+from .paginations import FavoritePagination, RecipePagination
 from .permissions import OwnerOrReadOnly
 from .serializers import (
     AddedFavoriteSerializer, AddedShoppingCartSerializer,
     AddFavoriteSerializer, AddShoppingCartSerializer,
     CreateIngredientsSerializer, DeleteFavoriteSerializer,
     DeleteShoppingCartSerializer, IngredientsSerializer,
-    RecipeCreateSerializer, RecipeIngredientSerializer, RecipeSerializer,
-    TagSerializer
+    RecipeCreateSerializer, RecipeIngredientSerializer, RecipeReadSerializer,
+    RecipeSerializer, TagSerializer
 )
-from .services import download_shopping_cart
+from .services import (
+    add_recipe_mark, apply_shopping_list_delta, download_shopping_cart,
+    get_amounts_delta, get_cart_user_ids, get_ingredient_amounts,
+    get_recipe_amounts, insert_ingredients, remove_recipe_mark,
+    update_recipe_fields, update_recipe_ingredients, update_recipe_tags
+)
+from users.authentication import CachedTokenAuthentication
 from users.models import ShoppingCartByUser
 
 User = get_user_model()
@@ -35,13 +46,14 @@ class RecipeIngredientViewSet(viewsets.ModelViewSet):
     queryset = RecipeIngredient.objects.all()
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """Операции связананные с Ingredients"""
 
     lookup_field = 'id'
     serializer_class = IngredientsSerializer
     search_fields = ('=id',)
     pagination_class = None
+    conditional_models = (Ingredient, MeasurementUnit)
 
     def get_permissions(self):
         """ Раздаем права на операции с ингредиентами"""
@@ -53,36 +65,101 @@ class IngredientViewSet(viewsets.ModelViewSet):
         return super().get_permissions()
 
     def get_queryset(self):
-        queryset = Ingredient.objects.all()
+        queryset = Ingredient.objects.select_related('measurement_unit')
         name = self.request.query_params.get('name')
         if name is not None:
-            return queryset.filter(title__contains=name.lower())
+            # Сначала ингредиенты, название которых начинается с name,
+            # без учета регистра и в том же порядке, что и в индексе:
+            # по байтам названия в нижнем регистре
+            needle = name.lower()
+            title_key = UnicodeLower('title')
+            if connection.vendor == 'postgresql':
+                title_key = Collate(title_key, 'C')
+            return queryset.annotate(
+                title_key=title_key).filter(
+                title_key__contains=needle).annotate(
+                prefix_match=Case(
+                    When(title_key__startswith=needle, then=Value(0)),
+                    default=Value(1),
+                    output_field=IntegerField())
+            ).order_by('prefix_match', 'title_key', 'id')
         return queryset
 
+    def get_conditional_versions(self):
+        versions = super().get_conditional_versions()
+        if self.request.query_params.get('name') is not None:
+            # индекс пересобирается фоновой задачей уже после смены версий
+            try:
+                index = get_index()
+            except (OSError, ValueError):
+                index = None
+            if index is not None:
+                versions['ingredient_index'] = index.stat.st_mtime
+        return versions
+
+    def list(self, request, *args, **kwargs):
+        """Поиск по названию выполняется по индексу в разделяемой
+        памяти, без индекса - запросом к БД, в обоих случаях не больше
+        INGREDIENT_SEARCH_LIMIT ингредиентов"""
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        ingredients = search_ingredients(name)
+        if ingredients is None:
+            ingredients = self.get_serializer(
+                self.get_queryset()[:settings.INGREDIENT_SEARCH_LIMIT],
+                many=True).data
+        return Response(ingredients)
+
     def create(self, request):
+        """Пакетный импорт ингредиентов, уже существующие пропускаются"""
         serializer = CreateIngredientsSerializer(data=request.data, many=True)
         serializer.is_valid(raise_exception=True)
-        ingredient_list = []
-        for field in serializer.validated_data:
-            title = field['title']
-            measurement_unit_obg, create = (
-                MeasurementUnit.objects.get_or_create(
-                    title=field['measurement_unit']))
-            ingredient_list.append(Ingredient(
-                title=title, measurement_unit=measurement_unit_obg))
-        Ingredient.objects.bulk_create(ingredient_list)
+        with transaction.atomic():
+            created, skipped = insert_ingredients([
+                (field['title'], field['measurement_unit'])
+                for field in serializer.validated_data
+            ])
+            # bulk_create не отправляет сигналы
+            schedule_rebuild()
+
+        return Response({'created': created, 'skipped': skipped},
+                        status=status.HTTP_200_OK)
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
 
+class RecipeReadMixin:
+    """Список и просмотр рецептов через RecipeReadSerializer,
+    остальные действия - через serializer_class"""
 
-class FavoriteViewSet(viewsets.ModelViewSet):
+    read_actions = ('list', 'retrieve')
+
+    def get_serializer_class(self):
+        if self.action in self.read_actions:
+            return RecipeReadSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        """Связанные объекты и признаки текущего пользователя
+        загружаются фиксированным числом запросов на страницу"""
+        queryset = super().get_queryset()
+        if self.action == 'destroy':
+            # для удаления нужны только id и автор рецепта
+            return queryset
+        queryset = queryset.with_user_flags(self.request.user)
+        if self.action in self.read_actions:
+            # теги и ингредиенты загружает RecipeReadSerializer
+            return queryset.select_related('author')
+        return queryset.with_related()
+
+
+class FavoriteViewSet(RecipeReadMixin, viewsets.ModelViewSet):
     """Список избранного"""
 
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = FavoritePagination
     permission_classes = (IsAuthenticatedOrReadOnly,)
-    authentication_classes = [TokenAuthentication, ]
+    authentication_classes = [CachedTokenAuthentication, ]
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
@@ -98,10 +175,8 @@ class AddFavorite(APIView):
             data={}, context={'request': request, 'recipe': recipe})
         serializer.is_valid(raise_exception=True)
 
-        add_favorite = (
-            FavoritedRecipeByUser(
-                current_user=self.request.user, recipe=recipe))
-        add_favorite.save()
+        with transaction.atomic():
+            add_recipe_mark(FavoritedRecipeByUser, self.request.user, recipe)
 
         favorite_serializer = AddedFavoriteSerializer(recipe)
         return Response(favorite_serializer.data, status=status.HTTP_200_OK)
@@ -114,9 +189,9 @@ class AddFavorite(APIView):
             data={}, context={'request': request, 'recipe': recipe})
         serializer.is_valid(raise_exception=True)
 
-        del_to_favorite = FavoritedRecipeByUser.objects.filter(
-            current_user=self.request.user, recipe=recipe)
-        del_to_favorite.delete()
+        with transaction.atomic():
+            remove_recipe_mark(
+                FavoritedRecipeByUser, self.request.user, recipe)
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -132,10 +207,10 @@ class AddShoppingCart(APIView):
             data={}, context={'request': request, 'recipe': recipe})
         serializer.is_valid(raise_exception=True)
 
-        add_to_shopping_cart = (
-            ShoppingCartByUser(
-                current_user=self.request.user, recipe=recipe))
-        add_to_shopping_cart.save()
+        with transaction.atomic():
+            add_recipe_mark(ShoppingCartByUser, self.request.user, recipe)
+            apply_shopping_list_delta(
+                [self.request.user.id], get_recipe_amounts(recipe))
 
         recipe_serializer = AddedShoppingCartSerializer(recipe)
         return Response(recipe_serializer.data, status=status.HTTP_200_OK)
@@ -148,20 +223,22 @@ class AddShoppingCart(APIView):
             data={}, context={'request': request, 'recipe': recipe})
         serializer.is_valid(raise_exception=True)
 
-        add_to_shopping_cart = ShoppingCartByUser.objects.filter(
-            current_user=self.request.user, recipe=recipe)
-
-        add_to_shopping_cart.delete()
+        with transaction.atomic():
+            remove_recipe_mark(ShoppingCartByUser, self.request.user, recipe)
+            apply_shopping_list_delta(
+                [self.request.user.id],
+                get_amounts_delta(get_recipe_amounts(recipe), {}))
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(RecipePageCacheMixin, RecipeReadMixin,
+                    viewsets.ModelViewSet):
     """Рецепты"""
 
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
-    pagination_class = CustomPageNumberPagination
+    pagination_class = RecipePagination
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
@@ -180,96 +257,80 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         serializer = RecipeCreateSerializer(data=request.data)
         if serializer.is_valid():
-            ingredients = serializer.validated_data['ingredients']
-            tags = serializer.validated_data['tags']
-            image = serializer.validated_data['image']
-            title = serializer.validated_data['title']
-            description = serializer.validated_data['description']
-            time = serializer.validated_data['time']
-            recipe = Recipe(author=self.request.user,
-                            title=title,
-                            image=image,
-                            description=description,
-                            time=time,)
-            recipe.save()
-
-            for tag in tags:
-                recipe.tags.add(tag)
-
-            # Разбор инредиентов из данных post запроса
-            for ingredient in ingredients:
-                object_ingredient = get_object_or_404(
-                    Ingredient, id=ingredient['id'])
-                recipe_ingredient = RecipeIngredient(
-                    amount=ingredient['amount'],
-                    recipe=recipe,
-                    recipe_ingredients=object_ingredient)
-                recipe_ingredient.save()
-
-                recipe_serializer = RecipeSerializer(
-                    recipe, context={'request': request})
+            amounts = get_ingredient_amounts(
+                serializer.validated_data['ingredients'])
+            with transaction.atomic():
+                recipe = Recipe.objects.create(
+                    author=self.request.user,
+                    title=serializer.validated_data['title'],
+                    image=serializer.validated_data['image'],
+                    description=serializer.validated_data['description'],
+                    time=serializer.validated_data['time'])
+                recipe.tags.set(serializer.validated_data['tags'])
+                RecipeIngredient.objects.bulk_create(
+                    RecipeIngredient(recipe=recipe,
+                                     recipe_ingredients_id=ingredient_id,
+                                     amount=amount)
+                    for ingredient_id, amount in amounts.items())
 
+            recipe_serializer = RecipeSerializer(
+                self.get_queryset().get(pk=recipe.pk),
+                context={'request': request})
             return Response(recipe_serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def partial_update(self, request, pk):
-        """Обновление рецепта"""
-        recipe = get_object_or_404(Recipe, id=pk)
+        """Обновление рецепта, записываются только изменения"""
 
-        # For has_object_permission on partial_update
-        # https://www.django-rest-framework.org/api-guide/generic-views/#get_objectself
-        self.get_object()
+        # get_object проверяет has_object_permission
+        recipe = self.get_object()
 
         serializer = RecipeCreateSerializer(
             recipe, data=request.data,
             context={'request': request}, partial=True)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-
-        RecipeIngredient.objects.filter(recipe=recipe).delete()
-        ingredients = serializer.data['ingredients']
-        for ingredient in ingredients:
-            object_ingredient = get_object_or_404(
-                Ingredient, id=ingredient['id'])
-            recipe_ingredient = RecipeIngredient(
-                amount=ingredient['amount'],
-                recipe=recipe,
-                recipe_ingredients=object_ingredient)
-            recipe_ingredient.save()
-
-            recipe_serializer = RecipeSerializer(
-                recipe, context={'request': request})
+        validated_data = serializer.validated_data
+        amounts = None
+        if 'ingredients' in validated_data:
+            amounts = get_ingredient_amounts(validated_data['ingredients'])
+
+        with transaction.atomic():
+            update_recipe_fields(recipe, validated_data)
+            if 'tags' in validated_data:
+                update_recipe_tags(recipe, validated_data['tags'])
+            if amounts is not None:
+                delta = update_recipe_ingredients(recipe, amounts)
+                apply_shopping_list_delta(get_cart_user_ids(recipe), delta)
 
         recipe_serializer = RecipeSerializer(
-            recipe, context={'request': request})
+            self.get_queryset().get(pk=recipe.pk),
+            context={'request': request})
         return Response(recipe_serializer.data, status=status.HTTP_200_OK)
 
     def destroy(self, request, pk):
         """Удаление рецепта"""
 
-        recipe = get_object_or_404(Recipe, id=pk)
-
-        # For has_object_permission on partial_update
-        # https://www.django-rest-framework.org/api-guide/generic-views/#get_objectself
-        self.get_object()
+        # get_object проверяет has_object_permission
+        recipe = self.get_object()
+        # сводные списки покупок обновляет foods.signals
         recipe.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """Теги"""
 
     permission_classes = (AllowAny,)
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     pagination_class = None
+    conditional_models = (Tag,)
 
 
 class DownloadShoppingCart(APIView):
     """Выгрузка списка покупок"""
 
     def get(self, request, format=None):
-        result_string = download_shopping_cart(request.user)
-        return HttpResponse(result_string,
-                            content_type='text/plain',
-                            status=status.HTTP_200_OK)
+        return StreamingHttpResponse(download_shopping_cart(request.user),
+                                     content_type='text/plain',
+                                     status=status.HTTP_200_OK)
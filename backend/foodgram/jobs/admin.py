@@ -0,0 +1,30 @@
+from django.contrib import admin
+
+from .models import Job
+from .queue import get_task_names
+from foodgram.admin import ScalableModelAdmin
+
+
+class TaskNameFilter(admin.SimpleListFilter):
+    """Фильтр по зарегистрированным задачам, без DISTINCT по таблице"""
+
+    title = 'Задача'
+    parameter_name = 'name'
+
+    def lookups(self, request, model_admin):
+        return [(name, name) for name in get_task_names()]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(name=self.value())
+        return queryset
+
+
+@admin.register(Job)
+class JobAdmin(ScalableModelAdmin):
+    list_display = (
+        'id', 'name', 'status', 'attempts', 'created', 'started', 'finished')
+    list_filter = ('status', TaskNameFilter)
+    # id растет вместе с created, но в отличие от него проиндексирован
+    ordering = ('-id',)
+    readonly_fields = ('started', 'finished', 'worker', 'last_error')
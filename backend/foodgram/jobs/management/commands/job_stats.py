@@ -0,0 +1,61 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from jobs.models import Job
+
+
+def percentile(values, share):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Статистика фоновых задач: очередь, пропускная способность, '
+            'время ожидания и выполнения')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=60,
+                            help='За сколько последних минут считать')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        for status, count in Job.objects.values_list('status').annotate(
+                count=Count('id')).order_by('status'):
+            self.stdout.write(f'{status}: {count}')
+        oldest = Job.objects.filter(
+            status=Job.QUEUED, run_after__lte=now
+        ).aggregate(oldest=Min('run_after'))['oldest']
+        if oldest:
+            self.stdout.write(
+                f'Ожидает дольше всех: {(now - oldest).total_seconds():.1f} с')
+
+        minutes = options['minutes']
+        finished = Job.objects.filter(
+            status__in=(Job.DONE, Job.FAILED),
+            finished__gte=now - timedelta(minutes=minutes),
+        ).values_list('name', 'status', 'created', 'started', 'finished')
+        stats = defaultdict(lambda: {'done': 0, 'failed': 0,
+                                     'waits': [], 'runs': []})
+        for name, status, created, started, finished_at in finished.iterator():
+            name_stats = stats[name]
+            name_stats[status] += 1
+            name_stats['waits'].append((started - created).total_seconds())
+            name_stats['runs'].append((finished_at - started).total_seconds())
+
+        self.stdout.write(f'\nЗа последние {minutes} мин:')
+        for name, name_stats in sorted(stats.items()):
+            total = name_stats['done'] + name_stats['failed']
+            self.stdout.write(
+                f'{name}: выполнено {name_stats["done"]}, '
+                f'ошибок {name_stats["failed"]}, '
+                f'{total / minutes:.2f} в мин; '
+                f'ожидание p50 {percentile(name_stats["waits"], 0.5):.2f} с, '
+                f'p95 {percentile(name_stats["waits"], 0.95):.2f} с; '
+                f'выполнение p50 {percentile(name_stats["runs"], 0.5):.3f} с, '
+                f'p95 {percentile(name_stats["runs"], 0.95):.3f} с')
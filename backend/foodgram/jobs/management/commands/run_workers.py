@@ -0,0 +1,79 @@
+import os
+import signal
+import socket
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from jobs.queue import claim, purge_finished, requeue_stale, run_job
+
+# как часто возвращать в очередь зависшие задачи, секунд
+MAINTENANCE_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = 'Запуск обработчиков фоновых задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Число параллельных обработчиков')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Пауза при пустой очереди, секунд')
+        parser.add_argument(
+            '--stale-timeout', type=int, default=600,
+            help='Через сколько секунд выполнения задача считается '
+                 'зависшей и возвращается в очередь')
+        parser.add_argument('--keep-days', type=int, default=7,
+                            help='Сколько дней хранить выполненные задачи')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить задачи из очереди и завершиться')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        if not options['once']:
+            for signal_number in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signal_number, lambda *args: stop.set())
+
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        threads = [
+            threading.Thread(
+                target=self.work,
+                args=(f'{prefix}:{number}', stop, options),
+                name=f'worker-{number}')
+            for number in range(options['workers'])
+        ]
+        self.stdout.write(
+            f'Запущено обработчиков: {len(threads)}, остановка - Ctrl+C')
+        for thread in threads:
+            thread.start()
+
+        self.maintain(options)
+        if not options['once']:
+            while not stop.wait(MAINTENANCE_INTERVAL):
+                self.maintain(options)
+        for thread in threads:
+            thread.join()
+        connection.close()
+        self.stdout.write(self.style.SUCCESS('Обработчики остановлены'))
+
+    def maintain(self, options):
+        requeued = requeue_stale(options['stale_timeout'])
+        if requeued:
+            self.stdout.write(f'Возвращено в очередь: {requeued}')
+        purge_finished(options['keep_days'])
+
+    def work(self, worker, stop, options):
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                job = claim(worker)
+                if job is not None:
+                    run_job(job)
+                    continue
+                if options['once']:
+                    return
+                stop.wait(options['poll'])
+        finally:
+            connection.close()
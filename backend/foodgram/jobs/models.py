@@ -0,0 +1,45 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """Фоновая задача"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField('Задача', max_length=200)
+    payload = models.JSONField('Аргументы', default=dict, blank=True)
+    status = models.CharField(
+        'Состояние', max_length=20, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField(
+        'Максимум попыток', default=5)
+    run_after = models.DateTimeField(
+        'Выполнить не раньше', default=timezone.now)
+    created = models.DateTimeField('Создана', auto_now_add=True)
+    started = models.DateTimeField('Начата', null=True, blank=True)
+    finished = models.DateTimeField('Завершена', null=True, blank=True)
+    worker = models.CharField('Обработчик', max_length=200, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ('-created',)
+        indexes = [
+            models.Index(
+                fields=['status', 'run_after'],
+                name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.id}'
@@ -0,0 +1,145 @@
+"""Очередь фоновых задач в таблице Job, без внешнего брокера.
+
+Функция регистрируется декоратором @task, задача ставится вызовом
+enqueue внутри транзакции запроса: обработчики увидят ее только после
+фиксации, при откате задача пропадает вместе с транзакцией.
+Обработчики (manage.py run_workers) забирают задачи через
+SELECT ... FOR UPDATE SKIP LOCKED, а на базах без SKIP LOCKED (SQLite) -
+условным UPDATE по состоянию задачи. Упавшие задачи повторяются
+с экспоненциальной задержкой.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+BACKOFF_BASE = 5
+BACKOFF_MAX = 60 * 60
+# сколько задач из начала очереди пробовать захватить без SKIP LOCKED
+CLAIM_CANDIDATES = 10
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def task(name, max_attempts=5):
+    """Регистрирует функцию как фоновую задачу name"""
+    def decorator(function):
+        _registry[name] = (function, max_attempts)
+        return function
+    return decorator
+
+
+def get_task_names():
+    return sorted(_registry)
+
+
+def enqueue(name, /, *, unique=False, delay=0, **payload):
+    """Ставит задачу в очередь. unique - не ставить, если такая же задача
+    еще ждет в очереди. С JOBS_EAGER задача выполняется в этом же процессе
+    после фиксации транзакции."""
+    if name not in _registry:
+        raise ValueError(f'Неизвестная задача {name}')
+    function, max_attempts = _registry[name]
+    if settings.JOBS_EAGER:
+        transaction.on_commit(lambda: function(**payload))
+        return None
+    if unique and Job.objects.filter(
+            name=name, payload=payload, status=Job.QUEUED).exists():
+        return None
+    return Job.objects.create(
+        name=name, payload=payload, max_attempts=max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay))
+
+
+def claim(worker):
+    """Забирает первую готовую к выполнению задачу или возвращает None"""
+    now = timezone.now()
+    queued = Job.objects.filter(
+        status=Job.QUEUED, run_after__lte=now).order_by('run_after', 'id')
+    values = {
+        'status': Job.RUNNING,
+        'started': now,
+        'worker': worker,
+        'attempts': F('attempts') + 1,
+    }
+    if connection.features.has_select_for_update_skip_locked:
+        job_id = _claim_skip_locked(queued, values)
+    else:
+        job_id = _claim_optimistic(queued, values)
+    if job_id is None:
+        return None
+    return Job.objects.get(id=job_id)
+
+
+def _claim_skip_locked(queued, values):
+    with transaction.atomic():
+        job_id = queued.select_for_update(skip_locked=True).values_list(
+            'id', flat=True).first()
+        if job_id is not None:
+            Job.objects.filter(id=job_id).update(**values)
+    return job_id
+
+
+def _claim_optimistic(queued, values):
+    # задачу получает тот, чей UPDATE первым сменил состояние
+    for job_id in queued.values_list('id', flat=True)[:CLAIM_CANDIDATES]:
+        if Job.objects.filter(id=job_id, status=Job.QUEUED).update(**values):
+            return job_id
+    return None
+
+
+def get_backoff(attempts):
+    """Задержка перед повтором: растет вдвое с каждой попыткой"""
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def run_job(job):
+    """Выполняет забранную задачу и записывает результат"""
+    jobs = Job.objects.filter(id=job.id)
+    try:
+        if job.name not in _registry:
+            raise LookupError(f'Неизвестная задача {job.name}')
+        function, _ = _registry[job.name]
+        function(**job.payload)
+    except Exception as error:
+        logger.exception('Задача %s завершилась ошибкой', job)
+        now = timezone.now()
+        if job.attempts >= job.max_attempts:
+            jobs.update(status=Job.FAILED, finished=now,
+                        last_error=repr(error))
+        else:
+            jobs.update(status=Job.QUEUED,
+                        run_after=now + get_backoff(job.attempts),
+                        last_error=repr(error))
+        return False
+    jobs.update(status=Job.DONE, finished=timezone.now())
+    return True
+
+
+def requeue_stale(timeout):
+    """Возвращает в очередь задачи, обработчик которых пропал,
+    не дождавшись их завершения"""
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.RUNNING, started__lt=now - timedelta(seconds=timeout))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, finished=now,
+        last_error='Превышено время выполнения')
+    return failed + stale.update(status=Job.QUEUED, run_after=now)
+
+
+def purge_finished(days):
+    """Удаляет выполненные задачи старше days дней"""
+    deleted, _ = Job.objects.filter(
+        status=Job.DONE,
+        finished__lt=timezone.now() - timedelta(days=days)).delete()
+    return deleted
@@ -1,6 +1,8 @@
 #!/bin/bash
-python manage.py makemigrations foods users
-python manage.py migrate 
+python manage.py makemigrations foods users jobs
+python manage.py migrate
+python manage.py load_ingredients data/ingredients.csv
+python manage.py build_ingredient_index
 python manage.py collectstatic --no-input
 python manage.py createsuperuser \
         --noinput \
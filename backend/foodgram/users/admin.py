@@ -2,19 +2,43 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
 from .models import ShoppingCartByUser, SubscribersByCurrentUser
+from foodgram.admin import CappedCountPaginator, ScalableModelAdmin
+from foods.admin import RecipeCounterAdminMixin, VersionedAdminMixin
+from foods.services import rebuild_shopping_lists
 
 
 @admin.register(ShoppingCartByUser)
-class ShoppingCartByUserAdmin(admin.ModelAdmin):
+class ShoppingCartByUserAdmin(RecipeCounterAdminMixin, ScalableModelAdmin):
     list_display = (
         'current_user', 'recipe')
+    list_select_related = ('current_user', 'recipe')
+    autocomplete_fields = ('current_user', 'recipe')
+
+    def save_model(self, request, obj, form, change):
+        user_ids = {obj.current_user_id,
+                    form.initial.get('current_user')} - {None}
+        super().save_model(request, obj, form, change)
+        rebuild_shopping_lists(user_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        rebuild_shopping_lists([obj.current_user_id])
+
+    def delete_queryset(self, request, queryset):
+        user_ids = set(queryset.values_list('current_user_id', flat=True))
+        super().delete_queryset(request, queryset)
+        rebuild_shopping_lists(user_ids)
 
 
 @admin.register(SubscribersByCurrentUser)
-class SubscribersByCurrentUserAdmin(admin.ModelAdmin):
+class SubscribersByCurrentUserAdmin(VersionedAdminMixin, ScalableModelAdmin):
     list_display = (
         'current_user', 'subscription')
+    list_select_related = ('current_user', 'subscription')
+    autocomplete_fields = ('current_user', 'subscription')
 
 
-UserAdmin.list_filter = ('email', 'first_name',
-                         'last_name', 'username')
+# email и имена ищутся через search_fields UserAdmin
+UserAdmin.list_filter = ('is_staff', 'is_active')
+UserAdmin.paginator = CappedCountPaginator
+UserAdmin.show_full_result_count = False
@@ -0,0 +1,130 @@
+"""Аутентификация по токену без запроса к БД на каждый запрос.
+
+В общем кэше проекта хранятся ключ токена, id пользователя и поля,
+нужные API; пароля в кэше нет. Выход, смена пароля, деактивация и любое
+другое сохранение пользователя удаляют его токен из общего кэша
+(users.signals). Если TOKEN_LOCAL_CACHE_TIMEOUT больше нуля, данные
+дополнительно хранятся в небольшом LRU-кэше процесса: тогда в других
+процессах удаленный токен действует еще до TOKEN_LOCAL_CACHE_TIMEOUT
+секунд.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router, transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+TOKEN_KEY = 'foodgram:auth:token:{}'
+
+# поля пользователя в кэше
+USER_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'is_active',
+    'is_staff', 'is_superuser')
+
+# {ключ кэша: (срок годности, данные токена)} от старых к новым
+_local_tokens = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def get_token_key(key):
+    # сам токен в ключах кэша не хранится
+    return TOKEN_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def get_local_token(cache_key):
+    if not settings.TOKEN_LOCAL_CACHE_TIMEOUT:
+        return None
+    with _local_lock:
+        expires, data = _local_tokens.get(cache_key, (0, None))
+        if expires < time.monotonic():
+            _local_tokens.pop(cache_key, None)
+            return None
+        _local_tokens.move_to_end(cache_key)
+        return data
+
+
+def set_local_token(cache_key, data):
+    if not settings.TOKEN_LOCAL_CACHE_TIMEOUT:
+        return
+    with _local_lock:
+        _local_tokens[cache_key] = (
+            time.monotonic() + settings.TOKEN_LOCAL_CACHE_TIMEOUT, data)
+        _local_tokens.move_to_end(cache_key)
+        while len(_local_tokens) > settings.TOKEN_LOCAL_CACHE_SIZE:
+            _local_tokens.popitem(last=False)
+
+
+def clear_local_tokens():
+    with _local_lock:
+        _local_tokens.clear()
+
+
+def invalidate_tokens(keys):
+    """Удаляет токены из кэшей после фиксации текущей транзакции"""
+    cache_keys = [get_token_key(key) for key in keys]
+
+    def invalidate():
+        with _local_lock:
+            for cache_key in cache_keys:
+                _local_tokens.pop(cache_key, None)
+        cache.delete_many(cache_keys)
+
+    if cache_keys:
+        transaction.on_commit(invalidate)
+
+
+def dump_token(token):
+    """Данные токена для кэша"""
+    return {
+        'key': token.key,
+        'created': token.created,
+        'user': {name: getattr(token.user, name) for name in USER_FIELDS},
+    }
+
+
+def build_instance(model, values):
+    """Экземпляр модели из части полей, остальные поля отложены и
+    загружаются из БД при обращении"""
+    names = [field.attname for field in model._meta.concrete_fields
+             if field.attname in values]
+    return model.from_db(
+        router.db_for_read(model), names, [values[name] for name in names])
+
+
+def load_token(data):
+    """Новые экземпляры токена и пользователя из данных кэша"""
+    user = build_instance(User, data['user'])
+    token = build_instance(Token, {
+        'key': data['key'], 'user_id': user.id, 'created': data['created']})
+    token.user = user
+    return token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с токеном и пользователем из кэша.
+    Каждый запрос получает свою копию пользователя, поэтому изменения
+    request.user не попадают в кэш. Пароль и другие поля, которых нет в
+    кэше, загружаются из БД при обращении к ним."""
+
+    def authenticate_credentials(self, key):
+        cache_key = get_token_key(key)
+        data = get_local_token(cache_key)
+        if data is None:
+            data = cache.get(cache_key)
+            if data is None:
+                # неверный токен и неактивный пользователь не кэшируются,
+                # ошибку формирует TokenAuthentication
+                user, token = super().authenticate_credentials(key)
+                data = dump_token(token)
+                cache.set(cache_key, data, settings.TOKEN_CACHE_TIMEOUT)
+            set_local_token(cache_key, data)
+        token = load_token(data)
+        return token.user, token
@@ -0,0 +1,60 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from users.authentication import (
+    CachedTokenAuthentication, clear_local_tokens, invalidate_tokens
+)
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Замер затрат на аутентификацию по токену: запрос к БД, '
+            'общий кэш и кэш процесса. Данные создаются внутри '
+            'транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = User.objects.create(username='bench_token_auth')
+            token = Token.objects.create(user=user)
+            request = Request(APIRequestFactory().get(
+                '/', HTTP_AUTHORIZATION=f'Token {token.key}'))
+            cached = CachedTokenAuthentication()
+            # кэш процесса замеряется и тогда, когда он выключен
+            variants = (
+                ('TokenAuthentication', TokenAuthentication(), None, 0),
+                ('общий кэш', cached, clear_local_tokens, 0),
+                ('кэш процесса', cached, None, 5),
+            )
+            for name, authentication, before, local_timeout in variants:
+                with override_settings(
+                        TOKEN_LOCAL_CACHE_TIMEOUT=local_timeout):
+                    self.measure(name, authentication, request, before,
+                                 options['requests'])
+            transaction.set_rollback(True)
+        invalidate_tokens([token.key])
+
+    def measure(self, name, authentication, request, before, count):
+        authentication.authenticate(request)
+        elapsed = 0
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(count):
+                if before is not None:
+                    before()
+                started = time.perf_counter()
+                authentication.authenticate(request)
+                elapsed += time.perf_counter() - started
+        self.stdout.write(
+            f'{name}: {elapsed / count * 1e6:.1f} мкс на запрос, '
+            f'запросов к БД: {len(queries.captured_queries) / count:g}')
@@ -0,0 +1,51 @@
+# Generated by Django 4.1 on 2026-10-18 18:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_list(apps, schema_editor):
+    RecipeIngredient = apps.get_model('foods', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('users', 'ShoppingListItem')
+    rows = RecipeIngredient.objects.filter(
+        recipe__shoppingcartbyuser__isnull=False
+    ).values(
+        'recipe__shoppingcartbyuser__current_user', 'recipe_ingredients'
+    ).annotate(total=models.Sum('amount')).order_by()
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(
+            current_user_id=row['recipe__shoppingcartbyuser__current_user'],
+            ingredient_id=row['recipe_ingredients'],
+            amount=row['total']) for row in rows.iterator()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('foods', '0009_rename_favoritedrecipesbyuser_favoritedrecipebyuser'),
+        ('users', '0004_alter_shoppingcartbyuser_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Количество')),
+                ('current_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Текущий пользователь')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='foods.ingredient', verbose_name='Ингредиент')),
+            ],
+            options={
+                'verbose_name': 'Сводный список покупок',
+                'verbose_name_plural': 'Сводный список покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('current_user', 'ingredient'), name='unique_current_user_ingredient'),
+        ),
+        migrations.RunPython(fill_shopping_list, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,7 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
-from foods.models import Recipe
+from foods.models import Ingredient, Recipe
 
 User = get_user_model()
 
@@ -33,6 +33,38 @@ class ShoppingCartByUser(models.Model):
         ]
 
 
+class ShoppingListItem(models.Model):
+    """Сводный список покупок пользователя: суммарное количество
+    ингредиента по всем рецептам из списка покупок. Поддерживается
+    приращениями при изменении списка покупок и рецептов в нем,
+    единица измерения определяется ингредиентом"""
+
+    current_user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Текущий пользователь'
+    )
+
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+
+    amount = models.IntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Сводный список покупок'
+        verbose_name_plural = 'Сводный список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['current_user', 'ingredient'],
+                name='unique_current_user_ingredient'
+            )
+        ]
+
+
 class SubscribersByCurrentUser(models.Model):
     """Подписчики текущего пользователя"""
 
@@ -6,6 +6,7 @@ from rest_framework.authtoken.models import Token
 from rest_framework.serializers import ValidationError
 
 from .models import SubscribersByCurrentUser
+from .services import get_subscription_ids
 from foods.models import FavoritedRecipeByUser
 from foods.serializers import AddedFavoriteSerializer
 
@@ -25,13 +26,10 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        if SubscribersByCurrentUser.objects.filter(
-                current_user=user, subscription=obj).exists():
-            return True
-        return False
+        # Значение из аннотации queryset, если она есть
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.pk in get_subscription_ids(self.context['request'])
 
 
 class RegisterUserSerializer(serializers.ModelSerializer):
@@ -89,6 +87,9 @@ class UserSerializerSubscribers(serializers.ModelSerializer):
         )
 
     def get_recipes_count(self, obj):
+        # Значение из аннотации SubscriptionViewSet, если она есть
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
 
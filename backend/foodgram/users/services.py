@@ -0,0 +1,18 @@
+from .models import SubscribersByCurrentUser
+
+
+def get_subscription_ids(request):
+    """Множество id авторов, на которых подписан текущий пользователь.
+    Загружается одним запросом и запоминается на время запроса."""
+
+    subscription_ids = getattr(request, '_subscription_ids', None)
+    if subscription_ids is None:
+        if request.user.is_anonymous:
+            subscription_ids = frozenset()
+        else:
+            subscription_ids = frozenset(
+                SubscribersByCurrentUser.objects.filter(
+                    current_user=request.user
+                ).values_list('subscription_id', flat=True))
+        request._subscription_ids = subscription_ids
+    return subscription_ids
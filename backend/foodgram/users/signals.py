@@ -0,0 +1,22 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_tokens
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(instance, **kwargs):
+    """Выход из системы: токен удален"""
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, **kwargs):
+    """Смена пароля, деактивация и изменение данных пользователя:
+    в кэше остался бы устаревший пользователь"""
+    invalidate_tokens(
+        Token.objects.filter(user=instance).values_list('key', flat=True))
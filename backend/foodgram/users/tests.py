@@ -0,0 +1,121 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .authentication import clear_local_tokens, get_token_key
+from .models import SubscribersByCurrentUser
+from foods.tests import LOCAL_CACHES, clear_caches, create_dataset
+
+User = get_user_model()
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class UserListTest(TestCase):
+    """Параметры фильтров рецептов не действуют на список пользователей"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_dataset(recipes=3)
+
+    def test_recipe_filters_ignored(self):
+        for params in ({'ordering': 'popular'}, {'tags': 'breakfast'},
+                       {'is_favorited': '1'}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/users/', params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    response.data['count'], User.objects.count())
+
+
+@override_settings(CACHES=LOCAL_CACHES, TOKEN_LOCAL_CACHE_TIMEOUT=0)
+class CachedTokenTest(TestCase):
+    """Токен из кэша перестает действовать при выходе, деактивации и
+    смене пароля; пароль в кэш не попадает"""
+
+    client_class = APIClient
+
+    def setUp(self):
+        clear_caches()
+        clear_local_tokens()
+        self.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='old-pass-1')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_me(self):
+        return self.client.get('/api/users/me/').status_code
+
+    def test_cache_without_password(self):
+        self.assertEqual(self.get_me(), 200)
+        data = cache.get(get_token_key(self.token.key))
+        self.assertEqual(data['user']['id'], self.user.id)
+        self.assertNotIn('password', data['user'])
+        self.assertNotIn(self.user.password, repr(data))
+        # токен и пользователь из кэша, запрос только подписок
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_me(), 200)
+
+    def test_logout(self):
+        self.assertEqual(self.get_me(), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_me(), 401)
+
+    def test_deactivation(self):
+        self.assertEqual(self.get_me(), 200)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.get_me(), 401)
+
+    def test_password_change(self):
+        self.assertEqual(self.get_me(), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/set_password/', {
+                'current_password': 'old-pass-1',
+                'new_password': 'new-pass-2-long'})
+        self.assertEqual(response.status_code, 204)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new-pass-2-long'))
+        self.assertEqual(User.objects.get(id=self.user.id).email,
+                         'cook@example.com')
+        self.assertIsNone(cache.get(get_token_key(self.token.key)))
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class SubscriptionListTest(TestCase):
+    """Последние рецепты загружаются только для авторов страницы"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_dataset(recipes=12)
+        SubscribersByCurrentUser.objects.bulk_create(
+            SubscribersByCurrentUser(current_user=cls.viewer,
+                                     subscription=author)
+            for author in User.objects.filter(
+                username__in=['author1', 'author2']))
+
+    def test_recipes_of_page_authors(self):
+        client = APIClient()
+        client.force_authenticate(self.viewer)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(
+                '/api/users/subscriptions/',
+                {'limit': 2, 'page': 2, 'recipes_limit': 2})
+        self.assertEqual(response.status_code, 200)
+        author = response.data['results'][0]
+        self.assertEqual(author['username'], 'author2')
+        self.assertEqual(author['recipes_count'], 4)
+        self.assertEqual(
+            [recipe['name'] for recipe in author['recipes']],
+            ['рецепт 11', 'рецепт 8'])
+        ranked = [query['sql'] for query in queries.captured_queries
+                  if 'ROW_NUMBER' in query['sql']]
+        self.assertEqual(len(ranked), 1)
+        # нумеруются рецепты только автора страницы
+        self.assertIn(f'IN ({author["id"]})', ranked[0])
@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
+from django.db.models import (
+    Count, Exists, OuterRef, Prefetch, Value, prefetch_related_objects
+)
 from django.shortcuts import get_object_or_404
-from django_filters import rest_framework as filters
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
@@ -14,8 +16,11 @@ from .serializers import (
     RegisterUserSerializer, SubscribeUser, UserSerializer,
     UserSerializerSubscribers
 )
-from foods.filters import RecipeFilter
-from foods.views import CustomPageNumberPagination
+from foods.cache import bump_versions
+from foods.models import Recipe
+from foods.paginations import (
+    CustomPageNumberPagination, SubscriptionPagination
+)
 
 User = get_user_model()
 
@@ -25,8 +30,6 @@ class UserViewSet(viewsets.ModelViewSet):
 
     serializer_class = UserSerializer
     permission_classes = (IsAuthenticated,)
-    filter_backends = (filters.DjangoFilterBackend,)
-    filterset_class = RecipeFilter
     pagination_class = CustomPageNumberPagination
 
     def get_permissions(self):
@@ -38,7 +41,12 @@ class UserViewSet(viewsets.ModelViewSet):
         return super(self.__class__, self).get_permissions()
 
     def get_queryset(self):
-        return User.objects.all()
+        user = self.request.user
+        if user.is_anonymous:
+            return User.objects.annotate(is_subscribed=Value(False))
+        return User.objects.annotate(
+            is_subscribed=Exists(SubscribersByCurrentUser.objects.filter(
+                current_user=user, subscription=OuterRef('pk'))))
 
     @action(
         detail=False, methods=['GET'], url_path='me',
@@ -66,13 +74,31 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
 
     serializer_class = UserSerializerSubscribers
     permission_classes = (IsAuthenticated,)
-    pagination_class = CustomPageNumberPagination
+    pagination_class = SubscriptionPagination
 
     def get_queryset(self):
+        """Авторы, на которых подписан пользователь, количество
+        рецептов - агрегатом"""
         current_user = self.request.user
         subscribers = current_user.subscribers.values_list('subscription')
         return User.objects.filter(
-            id__in=subscribers)
+            id__in=subscribers).annotate(
+            recipes_count=Count('recipes')).order_by('id')
+
+    def paginate_queryset(self, queryset):
+        """Рецепты загружаются одним запросом с ограничением
+        recipes_limit на автора и только для авторов текущей страницы"""
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            recipes = Recipe.objects.filter(
+                author__in=[author.id for author in page])
+            recipes_limit = self.request.query_params.get(
+                'recipes_limit', '')
+            if recipes_limit.isdigit():
+                recipes = recipes.top_per_author(int(recipes_limit))
+            prefetch_related_objects(
+                page, Prefetch('recipes', queryset=recipes))
+        return page
 
     def get_serializer_context(self):
         return {'request': self.request}
@@ -102,7 +128,9 @@ class ChangePassword(APIView):
             data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         user.set_password(serializer.data.get('new_password'))
-        user.save()
+        # пользователь запроса может быть из кэша токенов: остальные
+        # поля не перезаписываются
+        user.save(update_fields=['password'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -121,6 +149,7 @@ class AddSubscribe(APIView):
             SubscribersByCurrentUser(
                 current_user=self.request.user, subscription=user))
         add_subscribe.save()
+        bump_versions(SubscribersByCurrentUser)
 
         recipe_serializer = UserSerializerSubscribers(
             user, context={'request': request})
@@ -136,6 +165,7 @@ class AddSubscribe(APIView):
 
         add_to_subscribe = SubscribersByCurrentUser.objects.filter(
             current_user=self.request.user, subscription=user)
-        add_to_subscribe.delete()
+        if add_to_subscribe.delete()[0]:
+            bump_versions(SubscribersByCurrentUser)
 
         return Response(status=status.HTTP_204_NO_CONTENT)